@@ -0,0 +1,131 @@
+import hashlib
+import uuid
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Count, Max, Subquery, Value
+
+STATS = ('hits', 'misses', 'invalidations')
+
+
+def get_version(name):
+    '''Текущая версия набора данных, хранится в общем кеше.'''
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(*names):
+    '''Версии нескольких наборов данных за одно обращение к кешу.'''
+    versions = cache.get_many([f'version:{name}' for name in names])
+    return [
+        versions.get(f'version:{name}') or get_version(name)
+        for name in names
+    ]
+
+
+def set_versions(*names):
+    cache.set_many(
+        {f'version:{name}': uuid.uuid4().hex for name in names},
+        timeout=None,
+    )
+
+
+def bump_version(*names):
+    '''Меняет версии наборов данных после фиксации транзакции.'''
+    transaction.on_commit(lambda: set_versions(*names))
+
+
+def table_version(model):
+    '''
+    Версия таблицы по данным в самой базе.
+
+    Число строк и время последнего изменения меняются при любой
+    вставке, удалении или правке строки, в каком бы процессе они
+    ни были сделаны, поэтому такая версия одинакова во всех воркерах.
+    '''
+    return '{count}:{updated_at}'.format(**model.objects.aggregate(
+        count=Count('pk'), updated_at=Max('updated_at'),
+    ))
+
+
+def table_version_subqueries(model):
+    '''Части версии таблицы подзапросами, для аннотации другого запроса.'''
+    rows = model.objects.annotate(table=Value(1)).values('table').order_by()
+    return (
+        Subquery(rows.annotate(count=Count('pk')).values('count')),
+        Subquery(rows.annotate(updated_at=Max('updated_at')).values(
+            'updated_at',
+        )),
+    )
+
+
+def query_key(request):
+    '''Хеш адреса запроса с отсортированными параметрами.'''
+    query = '&'.join(
+        f'{name}={value}'
+        for name, values in sorted(request.query_params.lists())
+        for value in sorted(values)
+    )
+    return hashlib.md5(
+        f'{request.get_host()}{request.path}?{query}'.encode()
+    ).hexdigest()
+
+
+def recipe_list_key(request):
+    return 'recipes:list:{}:{}:{}:{}'.format(
+        *get_versions('recipes', 'tags', 'ingredients'), query_key(request),
+    )
+
+
+def recipe_detail_key(request, pk):
+    return 'recipes:detail:{}:{}:{}:{}'.format(
+        *get_versions(f'recipe:{pk}', 'tags', 'ingredients'),
+        query_key(request),
+    )
+
+
+def invalidate_recipes(*recipe_ids):
+    '''
+    Сбрасывает кеш ответов по рецептам после фиксации транзакции.
+
+    Меняется версия всех списков и версии страниц только указанных
+    рецептов, страницы остальных рецептов остаются в кеше.
+    '''
+    def invalidate():
+        set_versions(
+            'recipes', *(f'recipe:{recipe_id}' for recipe_id in recipe_ids),
+        )
+        record('invalidations')
+    transaction.on_commit(invalidate)
+
+
+def record(stat):
+    '''Увеличивает счётчик статистики кеша ответов.'''
+    key = f'stats:recipes:{stat}'
+    if cache.add(key, 1, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def is_process_local():
+    '''Хранится ли кеш в памяти процесса, а не в общем хранилище.'''
+    return isinstance(
+        caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache),
+    )
+
+
+def get_stats():
+    values = cache.get_many([f'stats:recipes:{stat}' for stat in STATS])
+    stats = {stat: values.get(f'stats:recipes:{stat}', 0) for stat in STATS}
+    requests = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / requests, 4) if requests else 0
+    return stats
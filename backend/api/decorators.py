@@ -0,0 +1,87 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .caching import is_process_local, record
+
+
+def make_etag(*parts):
+    '''Слабый ETag из произвольных значений.'''
+    digest = hashlib.md5(
+        '|'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def conditional_get(etag_method):
+    '''
+    Условный GET для метода представления.
+
+    etag_method — имя метода представления, который возвращает пару
+    (etag, last_modified) или None. Если ETag совпал с If-None-Match,
+    ответ 304 отдаётся до выборки и сериализации данных.
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            validators = getattr(self, etag_method)(request, *args, **kwargs)
+            if validators is None:
+                return method(self, request, *args, **kwargs)
+            etag, last_modified = validators
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(
+                        last_modified.timestamp(),
+                    )
+                patch_cache_control(response, no_cache=True)
+                patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_for_anonymous(key_method):
+    '''
+    Кеширует данные ответа для анонимных пользователей.
+
+    key_method — имя метода представления, который возвращает ключ кеша.
+    Хранятся данные ответа, а не отрендеренный текст, поэтому один ключ
+    обслуживает любые форматы вывода.
+
+    Кеш работает только с общим бэкендом: версии данных, которые меняют
+    другие воркеры и команды управления, в кеше процесса не видны,
+    поэтому с ним ответы не кешируются.
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated or is_process_local():
+                return method(self, request, *args, **kwargs)
+            key = getattr(self, key_method)(request, *args, **kwargs)
+            data = cache.get(key)
+            if data is not None:
+                record('hits')
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+            record('misses')
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(
+                    key, response.data,
+                    timeout=settings.RECIPE_CACHE_TIMEOUT,
+                )
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
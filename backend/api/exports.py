@@ -0,0 +1,106 @@
+import hashlib
+import json
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .renderers import SHOPPING_LIST_RENDERERS
+from .shopping_list import SPOOL_MAX_SIZE, shopping_list_rows
+from recipes.models import ShoppingListExport
+
+RENDERERS = {renderer.format: renderer for renderer in SHOPPING_LIST_RENDERERS}
+
+
+def cart_hash(user, format):
+    '''Хеш содержимого списка покупок вместе с форматом файла.'''
+    digest = hashlib.sha256(format.encode())
+    for row in shopping_list_rows(user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount',
+    ).iterator():
+        digest.update(json.dumps(row, ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+
+def expiry(now):
+    '''Время, после которого выгрузку удаляет delete_expired.'''
+    return now + timedelta(seconds=settings.EXPORT_TTL)
+
+
+def finished_file(digest, format):
+    '''Путь к готовому файлу с тем же содержимым, если он есть.'''
+    return ShoppingListExport.objects.filter(
+        cart_hash=digest, format=format, status=ShoppingListExport.DONE,
+        expires_at__gt=timezone.now(),
+    ).exclude(file='').values_list('file', flat=True).first()
+
+
+def enqueue_export(user, format):
+    '''
+    Ставит выгрузку списка покупок в очередь.
+
+    Если такой же список в том же формате уже выгружался, задание
+    сразу создаётся выполненным и ссылается на готовый файл.
+    '''
+    digest = cart_hash(user, format)
+    ready = finished_file(digest, format)
+    if ready is None:
+        return ShoppingListExport.objects.create(
+            user=user, format=format, cart_hash=digest,
+        )
+    now = timezone.now()
+    return ShoppingListExport.objects.create(
+        user=user, format=format, cart_hash=digest, file=ready,
+        status=ShoppingListExport.DONE, started_at=now, finished_at=now,
+        expires_at=expiry(now),
+    )
+
+
+def process_export(job):
+    '''
+    Формирует файл выгрузки и сохраняет результат в задании.
+
+    Хеш пересчитывается перед формированием: корзина могла измениться,
+    пока задание ждало в очереди, а одинаковый файл мог появиться.
+    Любая ошибка базы или хранилища отмечает задание неудачным.
+    '''
+    try:
+        job.cart_hash = cart_hash(job.user_id, job.format)
+        job.file = finished_file(job.cart_hash, job.format) or ''
+        if not job.file:
+            render_export(job)
+    except Exception as error:
+        job.status = ShoppingListExport.FAILED
+        job.error = str(error)
+    else:
+        job.status = ShoppingListExport.DONE
+    job.finished_at = timezone.now()
+    job.expires_at = expiry(job.finished_at)
+    job.save(update_fields=[
+        'status', 'cart_hash', 'file', 'error', 'finished_at', 'expires_at',
+    ])
+    return job
+
+
+def fail_export(job, error):
+    '''Отмечает задание неудачным одним UPDATE, не сохраняя остальные поля.'''
+    now = timezone.now()
+    return ShoppingListExport.objects.filter(pk=job.pk).update(
+        status=ShoppingListExport.FAILED, error=str(error),
+        finished_at=now, expires_at=expiry(now),
+    )
+
+
+def render_export(job):
+    renderer = RENDERERS[job.format]()
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+        for chunk in renderer.stream(
+            shopping_list_rows(job.user_id).iterator()
+        ):
+            buffer.write(chunk)
+        buffer.seek(0)
+        job.file.save(
+            f'{job.cart_hash}.{job.format}', File(buffer), save=False,
+        )
@@ -1,19 +1,153 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
 import webcolors
-from django.core.files.base import ContentFile
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from rest_framework import relations, serializers
+
+from recipes.images import VARIANTS
+
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
 class Base64ImageField(serializers.ImageField):
+    '''
+    Картинка в виде data URI (base64) или файла из multipart-запроса.
+
+    base64 декодируется частями во временный файл, который держится
+    в памяти до FILE_UPLOAD_MAX_MEMORY_SIZE и дальше сбрасывается
+    на диск. Размер и число пикселей проверяются до проверки картинки
+    Pillow, а файл не копируется в память целиком.
+    '''
+    default_error_messages = {
+        'invalid_base64': 'Некорректная картинка в base64.',
+        'too_large': 'Размер картинки больше {max_size} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+        decoded = isinstance(data, str) and data.startswith('data:image')
+        if decoded:
+            data = self.decode(data)
+        file = serializers.FileField.to_internal_value(self, data)
+        if file.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        self.check_image(file)
+        if decoded:
+            file.name = f'temp.{file.image.format.lower()}'
+        return file
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+    def decode(self, data):
+        '''
+        Декодирует data URI во временный файл.
 
-        return super().to_internal_value(data)
+        Переводы строк и пробелы внутри base64 пропускаются. Размер
+        проверяется по уже декодированным байтам, поэтому перенос строк
+        не мешает картинке у самого предела. Имя файла здесь без
+        расширения: расширение берётся из формата, который определил
+        Pillow, а не из заголовка data URI.
+        '''
+        start = data.find(';base64,')
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(';base64,')
+        buffer = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        )
+        size = 0
+        rest = ''
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = rest + ''.join(
+                    data[offset:offset + BASE64_CHUNK_SIZE].split(),
+                )
+                end = len(chunk) // 4 * 4
+                size += buffer.write(
+                    base64.b64decode(chunk[:end], validate=True),
+                )
+                if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+                    buffer.close()
+                    self.fail(
+                        'too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE,
+                    )
+                rest = chunk[end:]
+            if rest:
+                raise binascii.Error('Incomplete base64 data')
+        except binascii.Error:
+            buffer.close()
+            self.fail('invalid_base64')
+        buffer.seek(0)
+        file = File(buffer, name='temp')
+        file.size = size
+        return file
+
+    def check_image(self, file):
+        '''
+        Проверяет картинку так же, как ImageField Django, но без копии.
+
+        Pillow читает только заголовок, чтобы узнать размеры, и
+        verify() вызывается лишь для картинок в пределах IMAGE_MAX_PIXELS.
+        '''
+        from PIL import Image
+
+        if hasattr(file, 'temporary_file_path'):
+            source = file.temporary_file_path()
+        else:
+            file.seek(0)
+            source = file
+        try:
+            image = Image.open(source)
+            pixels = image.width * image.height
+        except Image.DecompressionBombError:
+            pixels = None
+        except Exception:
+            self.fail('invalid_image')
+        if pixels is None or pixels > settings.IMAGE_MAX_PIXELS:
+            self.fail('too_many_pixels', max_pixels=settings.IMAGE_MAX_PIXELS)
+        try:
+            image.verify()
+        except Exception:
+            self.fail('invalid_image')
+        file.image = image
+        file.content_type = Image.MIME.get(image.format)
+        file.seek(0)
+
+
+class ImageVariantsField(serializers.Field):
+    '''
+    Адреса уменьшенных копий картинки рецепта.
+
+    Пока копии не созданы или относятся к прежней картинке,
+    для всех размеров отдаётся адрес оригинала.
+    '''
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return dict.fromkeys(VARIANTS)
+        variants = recipe.image_variants
+        if variants.get('source') != recipe.image.name:
+            variants = {}
+        storage = recipe.image.storage
+        request = self.context.get('request')
+        urls = {}
+        for variant in VARIANTS:
+            url = (
+                storage.url(variants[variant]) if variant in variants
+                else recipe.image.url
+            )
+            urls[variant] = (
+                request.build_absolute_uri(url) if request is not None
+                else url
+            )
+        return urls
 
 
 class Hex2NameColor(serializers.Field):
@@ -26,3 +160,55 @@ class Hex2NameColor(serializers.Field):
         except ValueError:
             raise serializers.ValidationError('Для этого цвета нет имени')
         return data
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''
+    PrimaryKeyRelatedField, который умеет читать объекты пачкой.
+
+    После prefetch() значения берутся из загруженного одним запросом
+    словаря, без SELECT на каждый id. Ошибки те же, что у DRF.
+    '''
+    prefetched = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in relations.MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def prefetch(self, values):
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError):
+                continue
+        self.prefetched = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.prefetched is None:
+            return super().to_internal_value(data)
+        try:
+            instance = self.prefetched.get(self.to_pk(data))
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    '''Список id, которые загружаются одним запросом id__in.'''
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child_relation.prefetch(data)
+        return super().to_internal_value(data)
@@ -1,3 +1,7 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import Q
 from django_filters import CharFilter, NumberFilter, rest_framework as filters
 
 from recipes.models import Ingredient, Recipe
@@ -12,7 +16,7 @@ class IngredientFilter(filters.FilterSet):
 
 
 class RecipeFilter(filters.FilterSet):
-    name = CharFilter(field_name='name', lookup_expr='icontains')
+    name = CharFilter(method='search_by_name')
     author = NumberFilter(field_name='author')
     tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
     is_favorited = filters.BooleanFilter(
@@ -21,20 +25,57 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='order_recipes',
+    )
+
+    def search_by_name(self, queryset, name, value):
+        '''
+        Поиск по названию рецепта.
+
+        В PostgreSQL подстрока ищется по триграммному индексу, а слова —
+        по полнотекстовому индексу с русской морфологией; результаты
+        сортируются по релевантности. В остальных СУБД — icontains.
+        '''
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(name__icontains=value)
+        vector = SearchVector('name', config='russian')
+        query = SearchQuery(value, config='russian')
+        return queryset.alias(search=vector).filter(
+            Q(search=query) | Q(name__icontains=value)
+        ).annotate(
+            search_rank=(
+                SearchRank(vector, query) + TrigramSimilarity('name', value)
+            ),
+        ).order_by('-search_rank', *Recipe._meta.ordering)
+
+    def order_recipes(self, queryset, name, value):
+        '''
+        Сортировка по популярности.
+
+        Рецепты упорядочиваются по счётчику Recipe.favorites_count
+        и читаются по индексу recipe_popular_idx без подсчёта
+        избранного в запросе. Курсорная пагинация всегда идёт
+        по дате публикации.
+        '''
+        if value == 'popular':
+            return queryset.popular()
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated and value:
-            return queryset.filter(favorite__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated and value:
-            return queryset.filter(shopping_cart__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     class Meta:
         model = Recipe
         fields = ('is_favorited', 'is_in_shopping_cart',
-                  'name', 'author', 'tags')
+                  'name', 'author', 'tags', 'ordering')
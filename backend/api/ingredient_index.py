@@ -0,0 +1,88 @@
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .caching import table_version
+from recipes.models import Ingredient
+
+
+def fold(text):
+    '''Приводит строку к виду для поиска без учёта регистра и «ё».'''
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    '''
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся отсортированными, поиск по префиксу выполняется
+    двоичным поиском. Индекс перечитывается из базы, когда меняется
+    версия таблицы ингредиентов (api.caching.table_version) или
+    истекает INGREDIENT_INDEX_TTL. Версия сверяется с базой не чаще
+    раза в INGREDIENT_VERSION_CHECK_INTERVAL секунд, поэтому поиск
+    по тёплому индексу не обращается к базе.
+    '''
+
+    def __init__(self):
+        self.version = None
+        self.loaded_at = 0
+        self.checked_at = 0
+        self.state = ([], [], [])
+
+    def load(self, version):
+        '''
+        Перечитывает индекс из базы.
+
+        Ключи, записи и список по id собираются локально и подменяются
+        одним присваиванием, чтобы поток, который в это время ищет,
+        не увидел новые ключи вместе со старыми записями.
+        '''
+        rows = sorted(
+            (fold(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit',
+            )
+        )
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        keys = [row[0] for row in rows]
+        all_items = sorted(items, key=lambda item: item['id'])
+        self.state = (keys, items, all_items)
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def get_version(self, check=False):
+        '''
+        Версия таблицы, по которой построен индекс.
+
+        С базой версия сверяется при check или по истечении
+        INGREDIENT_VERSION_CHECK_INTERVAL, при расхождении индекс
+        перечитывается.
+        '''
+        now = time.monotonic()
+        interval = settings.INGREDIENT_VERSION_CHECK_INTERVAL
+        if check or now - self.checked_at > interval:
+            version = table_version(Ingredient)
+            self.checked_at = now
+            if version != self.version:
+                self.load(version)
+        if now - self.loaded_at > settings.INGREDIENT_INDEX_TTL:
+            self.load(self.version)
+        return self.version
+
+    def search(self, prefix):
+        '''Ингредиенты, название которых начинается с prefix, по id.'''
+        self.get_version()
+        keys, items, all_items = self.state
+        if not prefix:
+            return all_items
+        prefix = fold(prefix)
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        return sorted(items[start:end], key=lambda item: item['id'])
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет выгрузки списков покупок с истёкшим сроком хранения '
+        'вместе с файлами.'
+    )
+
+    def handle(self, *args, **options):
+        deleted = ShoppingListExport.objects.delete_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено выгрузок: {deleted}'
+        ))
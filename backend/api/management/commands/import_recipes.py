@@ -0,0 +1,63 @@
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.recipe_import import BATCH_SIZE, import_recipes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует рецепты из файла JSON Lines: по рецепту на строку. '
+        'Строки с ошибками пропускаются и выводятся с номером строки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл JSON Lines, «-» — стандартный ввод.',
+        )
+        parser.add_argument(
+            '--author', required=True,
+            help='Имя пользователя, от которого создаются рецепты.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько рецептов сохранять в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден'
+            )
+        start = time.perf_counter()
+
+        def progress(report):
+            self.stdout.write(
+                f'Импортировано рецептов: {report["imported"]} '
+                f'из {report["total"]}'
+            )
+
+        if options['path'] == '-':
+            report = import_recipes(
+                sys.stdin, author, options['batch_size'], progress,
+            )
+        else:
+            with open(options['path'], encoding='utf-8') as file:
+                report = import_recipes(
+                    file, author, options['batch_size'], progress,
+                )
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк: {report["total"]}, импортировано: {report["imported"]}, '
+            f'с ошибками: {len(report["errors"])} за {elapsed:.2f} с '
+            f'({report["total"] / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.caching import bump_version
+from recipes.models import Ingredient
+
+FIELDS = ('name', 'measurement_unit')
+
+
+def read_csv(file):
+    '''Строки CSV без заголовка: название, единица измерения.'''
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_json(file):
+    '''Массив объектов {"name": ..., "measurement_unit": ...}.'''
+    for item in json.load(file):
+        yield [item.get(field) for field in FIELDS]
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из CSV или JSON. '
+        'Уже существующие ингредиенты пропускаются, поэтому '
+        'повторный запуск ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.json'),
+            help='Файл с ингредиентами (по умолчанию ingredients.json).',
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним INSERT.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or os.path.splitext(path)[1][1:].lower()
+        if format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла {path}, укажите --format'
+            )
+        max_lengths = [
+            Ingredient._meta.get_field(field).max_length for field in FIELDS
+        ]
+        start = time.perf_counter()
+        total = 0
+        with open(path, encoding='utf-8', newline='') as file, \
+                transaction.atomic():
+            before = Ingredient.objects.count()
+            rows = READERS[format](file)
+            while True:
+                batch = []
+                for number, row in enumerate(
+                    islice(rows, options['batch_size']), start=total + 1,
+                ):
+                    values = [str(value or '').strip() for value in row[:2]]
+                    if len(row) < 2 or not all(values) or any(
+                        len(value) > max_length
+                        for value, max_length in zip(values, max_lengths)
+                    ):
+                        raise CommandError(
+                            f'Строка {number}: некорректный ингредиент {row}'
+                        )
+                    batch.append(Ingredient(
+                        name=values[0], measurement_unit=values[1],
+                    ))
+                if not batch:
+                    break
+                total += len(batch)
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            created = Ingredient.objects.count() - before
+        if created:
+            bump_version('ingredients')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {total}, добавлено ингредиентов: {created} '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from api.exports import fail_export, process_export
+from recipes.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь выгрузок списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать накопившиеся задания и завершиться.',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            default=settings.EXPORT_WORKER_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, секунд.',
+        )
+
+    def handle(self, *args, **options):
+        cleaned_at = None
+        while True:
+            close_old_connections()
+            job = ShoppingListExport.objects.claim(
+                settings.EXPORT_JOB_TIMEOUT,
+            )
+            if job is None:
+                if cleaned_at is None or (
+                    time.monotonic() - cleaned_at
+                    > settings.EXPORT_CLEANUP_INTERVAL
+                ):
+                    self.delete_expired()
+                    cleaned_at = time.monotonic()
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            try:
+                process_export(job)
+            except Exception as error:
+                self.stderr.write(f'{job.pk}: {error}')
+                try:
+                    fail_export(job, error)
+                except DatabaseError:
+                    # Задание останется RUNNING и будет взято повторно
+                    # через EXPORT_JOB_TIMEOUT.
+                    pass
+                continue
+            self.stdout.write(f'{job.pk}: {job.status}')
+
+    def delete_expired(self):
+        '''Удаляет истёкшие выгрузки, пока очередь пуста.'''
+        try:
+            deleted = ShoppingListExport.objects.delete_expired()
+        except (DatabaseError, OSError) as error:
+            self.stderr.write(f'Не удалось удалить старые выгрузки: {error}')
+            return
+        if deleted:
+            self.stdout.write(f'Удалено старых выгрузок: {deleted}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.caching import get_stats, is_process_local
+
+
+class Command(BaseCommand):
+    help = 'Показывает статистику кеша ответов по рецептам.'
+
+    def handle(self, *args, **options):
+        if is_process_local():
+            raise CommandError(
+                'Кеш Django хранится в памяти процесса, и команда видит '
+                'только собственные счётчики, а не счётчики веб-сервера. '
+                'Запросите GET /api/recipes/cache_stats/ от имени '
+                'администратора или укажите общий CACHE_BACKEND.'
+            )
+        stats = get_stats()
+        self.stdout.write(
+            'Попаданий: {hits}, промахов: {misses}, '
+            'доля попаданий: {hit_ratio:.2%}, '
+            'сбросов: {invalidations}'.format(**stats)
+        )
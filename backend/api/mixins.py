@@ -2,33 +2,63 @@ from rest_framework import status
 from rest_framework.response import Response
 
 from recipes.models import Recipe
-from .serializers import RecipeShortSerializer
+from .serializers import RecipeBatchSerializer, RecipeShortSerializer
 
 
 class FavoriteAndShoppingCartActionsMixin:
 
     def favorite_and_shopping_cart_actions(self, request, pk, model):
+        '''
+        Добавляет рецепт в избранное или корзину либо удаляет его.
+
+        Изменение делается одним INSERT ... ON CONFLICT DO NOTHING или
+        одним DELETE, ответ выбирается по числу затронутых строк.
+        '''
         user = self.request.user
-        recipe_objects = Recipe.objects.filter(id=pk).exists()
+        try:
+            pk = int(pk)
+        except ValueError:
+            return Response({'errors': 'Рецепт не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
         if request.method == 'POST':
-            if not recipe_objects:
-                return Response({'errors': 'Рецепт не найден'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            recipe = Recipe.objects.get(id=pk)
-            if model.objects.filter(recipe=recipe, user=user).exists():
-                return Response({'errors': 'Рецепт уже в избранном'},
+            if model.objects.add(user, [pk]):
+                recipe = Recipe.objects.only(
+                    *RecipeShortSerializer.Meta.fields,
+                ).get(pk=pk)
+                serializer = RecipeShortSerializer(
+                    recipe, context={'request': request},
+                )
+                return Response(serializer.data,
+                                status=status.HTTP_201_CREATED)
+            if not Recipe.objects.filter(id=pk).exists():
+                return Response({'errors': 'Рецепт не найден'},
                                 status=status.HTTP_400_BAD_REQUEST)
-            model.objects.create(user=user, recipe=recipe)
+            return Response({'errors': 'Рецепт уже в избранном'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if model.objects.remove(user, [pk]):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(id=pk).exists():
+            return Response({'errors': 'Рецепт не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response({'errors': 'Рецепта для удаления нет'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def favorite_and_shopping_cart_batch(self, request, model):
+        '''
+        Добавляет или удаляет сразу несколько рецептов.
+
+        Уже добавленные и уже удалённые рецепты пропускаются,
+        поэтому повторный запрос ничего не меняет.
+        '''
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        recipe_ids = [recipe.pk for recipe in recipes]
+        if request.method == 'POST':
+            model.objects.add(request.user, recipe_ids)
             serializer = RecipeShortSerializer(
-                recipe, context={'request': request},
+                recipes, many=True, context={'request': request},
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if not recipe_objects:
-            return Response({'errors': 'Рецепт не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        recipe = Recipe.objects.get(id=pk)
-        if not model.objects.filter(recipe=recipe, user=user).exists():
-            return Response({'errors': 'Рецепта для удаления нет'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        model.objects.filter(recipe=recipe, user=user).delete()
+        model.objects.remove(request.user, recipe_ids)
         return Response(status=status.HTTP_204_NO_CONTENT)
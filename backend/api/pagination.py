@@ -1,6 +1,205 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import heapq
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+def encode_cursor(pub_date, pk, reverse=False):
+    '''Упаковывает позицию (pub_date, id) в непрозрачную строку.'''
+    position = {'d': pub_date.isoformat(), 'i': pk}
+    if reverse:
+        position['r'] = 1
+    return base64.urlsafe_b64encode(
+        json.dumps(position).encode()
+    ).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    '''Разбирает курсор, возвращает (pub_date, id, reverse).'''
+    try:
+        position = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)
+        ))
+        pub_date = parse_datetime(position['d'])
+        pk = int(position['i'])
+    except (TypeError, ValueError, KeyError):
+        raise NotFound('Неверный курсор')
+    if pub_date is None:
+        raise NotFound('Неверный курсор')
+    return pub_date, pk, bool(position.get('r'))
+
+
+def keyset_filter(queryset, pub_date, pk, reverse=False,
+                  date_field='pub_date', pk_field='id'):
+    '''Оставляет записи после позиции (pub_date, id) в порядке ленты.'''
+    if reverse:
+        return queryset.filter(**{f'{date_field}__gte': pub_date}).filter(
+            Q(**{f'{date_field}__gt': pub_date})
+            | Q(**{date_field: pub_date, f'{pk_field}__gt': pk})
+        )
+    return queryset.filter(**{f'{date_field}__lte': pub_date}).filter(
+        Q(**{f'{date_field}__lt': pub_date})
+        | Q(**{date_field: pub_date, f'{pk_field}__lt': pk})
+    )
+
+
+class RecipeCursorPagination(BasePagination):
+    '''
+    Курсорная пагинация рецептов по ключу (pub_date, id).
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница читается
+    по индексу от позиции, закодированной в курсоре.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = CustomPagination.page_size_query_param
+    page_size = CustomPagination.page_size
+    max_page_size = CustomPagination.max_page_size
+    ordering = ('-pub_date', '-id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if cursor:
+            pub_date, pk, reverse = decode_cursor(cursor)
+            queryset = keyset_filter(queryset, pub_date, pk, reverse)
+        if reverse:
+            queryset = queryset.order_by('pub_date', 'id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        page = list(queryset[:page_size + 1])
+        return self.finish_page(
+            page, page_size, cursor, reverse,
+            lambda recipe: (recipe.pub_date, recipe.pk),
+        )
+
+    def finish_page(self, page, page_size, cursor, reverse, position):
+        '''Обрезает страницу и запоминает позиции соседних страниц.'''
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+        if not page:
+            self.next_position = self.previous_position = None
+            return page
+        first, last = page[0], page[-1]
+        self.next_position = (
+            position(last) if has_more or reverse else None
+        )
+        self.previous_position = (
+            position(first)
+            if (has_more if reverse else bool(cursor)) else None
+        )
+        return page
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            encode_cursor(*position, reverse=reverse),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('next', self.get_link(self.next_position, reverse=False)),
+            ('previous', self.get_link(self.previous_position, reverse=True)),
+            ('results', data),
+        )))
+
+
+class RecipePagination(CustomPagination):
+    '''
+    Постраничная выдача рецептов.
+
+    По умолчанию работает как CustomPagination. Если в запросе есть
+    параметр cursor (в том числе пустой для первой страницы),
+    используется курсорная пагинация без подсчёта количества.
+    '''
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view,
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(RecipeCursorPagination):
+    '''
+    Курсорная пагинация ленты подписок.
+
+    Лента сливается из нескольких источников позиций (pub_date, id):
+    таймлайна пользователя и рецептов авторов, которые не рассылаются
+    по лентам. Из каждого источника читается не больше страницы.
+    '''
+
+    def paginate_sources(self, sources, request):
+        '''
+        Возвращает позиции (pub_date, recipe_id) текущей страницы.
+
+        sources — последовательность (queryset, date_field, pk_field).
+        '''
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if cursor:
+            pub_date, pk, reverse = decode_cursor(cursor)
+        direction = '' if reverse else '-'
+        streams = []
+        for queryset, date_field, pk_field in sources:
+            if cursor:
+                queryset = keyset_filter(
+                    queryset, pub_date, pk, reverse, date_field, pk_field,
+                )
+            streams.append(queryset.order_by(
+                direction + date_field, direction + pk_field,
+            ).values_list(date_field, pk_field)[:page_size + 1])
+        page = []
+        seen = set()
+        for position in heapq.merge(*streams, reverse=not reverse):
+            if position[1] in seen:
+                continue
+            seen.add(position[1])
+            page.append(position)
+            if len(page) > page_size:
+                break
+        return self.finish_page(
+            page, page_size, cursor, reverse, lambda position: position,
+        )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+
+class JSONLinesParser(BaseParser):
+    '''
+    Разбирает тело запроса в формате JSON Lines.
+
+    Тело не читается целиком: возвращается генератор строк,
+    которые читаются из потока по мере обработки.
+    '''
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return (
+            line.decode(encoding) for line in iter(stream.readline, b'')
+        )
@@ -0,0 +1,149 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from .caching import invalidate_recipes
+from .serializers import RecipeImportSerializer
+from recipes.images import schedule_variants
+from recipes.models import (FeedEntry, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from recipes.signals import defer_counters
+
+BATCH_SIZE = 500
+
+User = get_user_model()
+
+
+def import_context():
+    '''Словари тегов и ингредиентов для разбора строк импорта.'''
+    return {
+        'tags': dict(Tag.objects.exclude(slug=None).values_list('slug', 'id')),
+        'ingredients': {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit',
+            ).iterator()
+        },
+    }
+
+
+def parse_line(line, context):
+    '''Возвращает (данные рецепта, None) или (None, ошибки строки).'''
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None, {'non_field_errors': ['Строка не является JSON']}
+    if not isinstance(data, dict):
+        return None, {'non_field_errors': ['Ожидался объект рецепта']}
+    serializer = RecipeImportSerializer(data=data, context=context)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return serializer.validated_data, None
+
+
+def save_batch(rows, author):
+    '''
+    Сохраняет пачку рецептов в одной транзакции.
+
+    Рецепты, теги и ингредиенты вставляются через bulk_create.
+    На базах без RETURNING в INSERT (SQLite) рецепты сохраняются
+    по одному, потому что нужны их id; счётчик рецептов автора
+    при этом пересчитывается один раз на пачку. bulk_create
+    не отправляет post_save, поэтому там счётчик увеличивается здесь.
+    '''
+    recipes = [
+        Recipe(
+            author=author, name=row['name'], text=row['text'],
+            cooking_time=row['cooking_time'], image=row['image'],
+        )
+        for row in rows
+    ]
+    with transaction.atomic(), defer_counters():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            schedule_variants(*(recipe.pk for recipe in recipes))
+            User.objects.filter(pk=author.pk).update(
+                recipes_count=F('recipes_count') + len(recipes),
+            )
+        else:
+            for recipe in recipes:
+                recipe.save()
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, row in zip(recipes, rows)
+                for tag_id in row['tags']
+            ),
+            batch_size=1000,
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, row in zip(recipes, rows)
+                for ingredient_id, amount in row['ingredients'].items()
+            ),
+            batch_size=1000,
+        )
+        FeedEntry.objects.fan_out(*recipes)
+        invalidate_recipes()
+    return recipes
+
+
+def flush_batch(batch, author, report):
+    '''
+    Сохраняет пачку пронумерованных строк и дополняет отчёт.
+
+    Если пачка не сохранилась целиком, её строки сохраняются
+    по одной, чтобы ошибка базы не теряла остальные рецепты.
+    '''
+    try:
+        save_batch([row for _, row in batch], author)
+        report['imported'] += len(batch)
+        return
+    except DatabaseError:
+        pass
+    for number, row in batch:
+        try:
+            save_batch([row], author)
+            report['imported'] += 1
+        except DatabaseError as error:
+            report['errors'].append({
+                'line': number,
+                'errors': {'non_field_errors': [str(error)]},
+            })
+
+
+def import_recipes(lines, author, batch_size=BATCH_SIZE, on_batch=None):
+    '''
+    Импортирует рецепты из строк JSONL от имени автора.
+
+    Строки с ошибками пропускаются и попадают в отчёт с номером
+    строки, остальные сохраняются пачками по batch_size.
+    '''
+    context = import_context()
+    report = {'total': 0, 'imported': 0, 'errors': []}
+    batch = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        report['total'] += 1
+        row, errors = parse_line(line, context)
+        if errors is not None:
+            report['errors'].append({'line': number, 'errors': errors})
+            continue
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            flush_batch(batch, author, report)
+            batch = []
+            if on_batch is not None:
+                on_batch(report)
+    if batch:
+        flush_batch(batch, author, report)
+        if on_batch is not None:
+            on_batch(report)
+    return report
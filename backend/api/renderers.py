@@ -0,0 +1,94 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+from .shopping_list import ingredient_lines, render_pdf
+
+
+class Echo:
+    '''Псевдофайл для csv.writer: возвращает строку вместо записи.'''
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    '''
+    Базовый формат списка покупок.
+
+    Наследники отдают документ по частям через stream(), чтобы ответ
+    можно было передавать клиенту, не собирая его целиком в памяти.
+    '''
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(data))
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    chunk_size = 64 * 1024
+
+    def stream(self, ingredients):
+        buffer, _ = render_pdf(ingredients)
+        with buffer:
+            yield from iter(lambda: buffer.read(self.chunk_size), b'')
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Количество', 'Единица измерения')
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['ingredient_amount'],
+                ingredient['ingredient__measurement_unit'],
+            )).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        empty = True
+        for text in ingredient_lines(ingredients):
+            if empty:
+                yield 'Что купить:\n'.encode(self.charset)
+                empty = False
+            yield f'{text}\n'.encode(self.charset)
+        if empty:
+            yield 'Список покупок пуст!\n'.encode(self.charset)
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield (separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['ingredient_amount'],
+            }, ensure_ascii=False)).encode(self.charset)
+            separator = ','
+        yield ('[]' if separator == '[' else ']').encode(self.charset)
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListPDFRenderer, ShoppingListJSONRenderer,
+    ShoppingListCSVRenderer, ShoppingListTextRenderer,
+)
@@ -1,12 +1,21 @@
+import json
 import re
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers, status
-
-from .fields import Base64ImageField, Hex2NameColor
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from rest_framework.reverse import reverse
+
+from .exports import enqueue_export
+from .fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                     Hex2NameColor, ImageVariantsField)
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingListExport, Tag)
+from recipes.signals import defer_recipe_updates, refresh_recipe_shopping_lists
 from users.models import Follow
 
 
@@ -28,6 +37,24 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return username
 
 
+def get_followed_author_ids(request):
+    '''
+    Id авторов, на которых подписан пользователь запроса.
+
+    Читаются одним запросом и запоминаются на объекте запроса, чтобы
+    все сериализаторы пользователей в ответе обходились без запросов.
+    '''
+    if not request or request.user.is_anonymous:
+        return frozenset()
+    followed_author_ids = getattr(request, 'followed_author_ids', None)
+    if followed_author_ids is None:
+        followed_author_ids = frozenset(Follow.objects.filter(
+            user=request.user,
+        ).values_list('author_id', flat=True))
+        request.followed_author_ids = followed_author_ids
+    return followed_author_ids
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -37,13 +64,9 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            return Follow.objects.filter(
-                user=request.user,
-                author=obj
-            ).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_followed_author_ids(self.context.get('request'))
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -73,8 +96,27 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    '''
+    Список вложенных объектов со ссылками, загружаемыми пачкой.
+
+    Перед разбором элементов все значения каждого поля
+    BulkPrimaryKeyRelatedField загружаются одним запросом.
+    '''
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for field in self.child.fields.values():
+                if isinstance(field, BulkPrimaryKeyRelatedField):
+                    field.prefetch(
+                        item[field.field_name] for item in data
+                        if isinstance(item, dict) and field.field_name in item
+                    )
+        return super().to_internal_value(data)
+
+
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         source='ingredient',
     )
@@ -82,6 +124,7 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = BulkRelatedListSerializer
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -92,37 +135,30 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'author', 'ingredients', 'tags', 'image',
+            'id', 'author', 'ingredients', 'tags', 'image', 'image_variants',
             'name', 'text', 'cooking_time', 'is_favorited',
             'is_in_shopping_cart',
         )
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            return Favorite.objects.filter(
-                user=request.user, recipe=obj,
-            ).exists()
-        return False
+        return getattr(obj, 'is_favorited', False)
 
-    def get_is_in_shopping_cart(self, instance):
-        request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            return instance.shopping_cart.filter(user=request.user).exists()
-        return False
+    def get_is_in_shopping_cart(self, obj):
+        return getattr(obj, 'is_in_shopping_cart', False)
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     author = CustomUserSerializer(read_only=True, required=False)
     ingredients = RecipeIngredientCreateSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True,
     )
 
@@ -136,23 +172,100 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients_data
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.ingredients_data_create(ingredients_data, recipe)
+        FeedEntry.objects.fan_out(recipe)
         return recipe
 
+    def ingredients_data_update(self, ingredients_data, recipe):
+        '''
+        Приводит ингредиенты рецепта к переданным, меняя только разницу.
+
+        Новые строки добавляются, у оставшихся обновляется количество,
+        лишние удаляются. Возвращает id затронутых ингредиентов.
+        '''
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        wanted = {
+            ingredient['ingredient'].pk: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        removed = current.keys() - wanted.keys()
+        changed = [
+            recipe_ingredient
+            for ingredient_id, recipe_ingredient in current.items()
+            if ingredient_id in wanted
+            and recipe_ingredient.amount != wanted[ingredient_id]
+        ]
+        for recipe_ingredient in changed:
+            recipe_ingredient.amount = wanted[recipe_ingredient.ingredient_id]
+        added = wanted.keys() - current.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient__in=removed,
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=wanted[ingredient_id],
+                )
+                for ingredient_id in added
+            )
+        return removed | added | {
+            recipe_ingredient.ingredient_id for recipe_ingredient in changed
+        }
+
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.ingredients_data_create(ingredients_data, instance)
-        return super().update(instance, validated_data)
+        with transaction.atomic(), defer_recipe_updates():
+            if tags is not None:
+                instance.tags.set(tags)
+            if ingredients_data is not None:
+                changed = self.ingredients_data_update(
+                    ingredients_data, instance,
+                )
+                if changed:
+                    refresh_recipe_shopping_lists(instance.pk, changed)
+            return super().update(instance, validated_data)
+
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.multipart_data(data)
+        return super().to_internal_value(data)
+
+    def multipart_data(self, data):
+        '''
+        Приводит multipart-форму к виду JSON-запроса.
+
+        Картинка передаётся файлом в поле image, теги — повторяющимся
+        полем tags, ингредиенты — JSON-списком в поле ingredients.
+        '''
+        result = data.dict()
+        if 'tags' in data:
+            result['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                result['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': ['Ожидался JSON-список ингредиентов']}
+                )
+        return result
 
     def validate(self, data):
+        if self.partial:
+            return data
         ingredients = data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError(
@@ -173,14 +286,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 {'errors': 'Добавьте ингредиенты'},
                 status.HTTP_400_BAD_REQUEST,
             )
-        ingredients = []
-        for ingredient in data:
-            if ingredient['ingredient'].id in ingredients:
-                raise serializers.ValidationError(
-                    {'errors': 'Ингредиенты должны быть уникальными'},
-                    status.HTTP_400_BAD_REQUEST,
-                )
-            ingredients.append(ingredient['ingredient'].id)
+        ingredients = {ingredient['ingredient'].pk for ingredient in data}
+        if len(ingredients) != len(data):
+            raise serializers.ValidationError(
+                {'errors': 'Ингредиенты должны быть уникальными'},
+                status.HTTP_400_BAD_REQUEST,
+            )
         return data
 
     def validate_tags(self, data):
@@ -189,14 +300,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 {'errors': 'Добавьте теги'},
                 status.HTTP_400_BAD_REQUEST,
             )
-        tags = []
-        for tag in data:
-            if tag in tags:
-                raise serializers.ValidationError(
-                    {'errors': 'Теги должны быть уникальными'},
-                    status.HTTP_400_BAD_REQUEST,
-                )
-            tags.append(tag)
+        if len({tag.pk for tag in data}) != len(data):
+            raise serializers.ValidationError(
+                {'errors': 'Теги должны быть уникальными'},
+                status.HTTP_400_BAD_REQUEST,
+            )
         return data
 
     def validate_cooking_time(self, data):
@@ -208,9 +316,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.for_read(request.user).get(pk=instance.pk)
         return RecipeSerializer(
             instance,
-            context={'request': self.context.get('request')},
+            context={'request': request},
         ).data
 
     class Meta:
@@ -252,9 +362,27 @@ class FollowCreateSerializer(serializers.ModelSerializer):
         return data
 
 
+def parse_recipes_limit(request):
+    '''Значение recipes_limit из запроса или None, если лимит не задан.'''
+    value = request.query_params.get('recipes_limit') if request else None
+    if not value:
+        return None
+    if not value.isdigit():
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Укажите целое неотрицательное число'},
+        )
+    return int(value)
+
+
 class FollowSerializer(CustomUserSerializer):
+    '''
+    Автор с его рецептами для страницы подписок.
+
+    Для списка авторов вьюха передаёт в контексте recipes_by_author
+    с уже выбранными рецептами, иначе рецепты читаются по автору.
+    Количество рецептов берётся из счётчика User.recipes_count.
+    '''
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -264,28 +392,48 @@ class FollowSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
-        recipes_queryset = Recipe.objects.filter(author=obj)
         request = self.context.get('request')
-        if request and not request.user.is_anonymous:
-            if 'recipes_limit' in request.GET:
-                recipes_limit = request.GET.get('recipes_limit')
-                if recipes_limit:
-                    recipes_queryset = recipes_queryset[:int(recipes_limit)]
-
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.pk, [])
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            recipes_limit = parse_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeShortSerializer(
-            recipes_queryset,
+            recipes,
             context={'request': request},
             many=True,
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    '''Список рецептов для пакетного изменения избранного или корзины.'''
+    recipes = BulkPrimaryKeyRelatedField(
+        queryset=Recipe.objects.only(*RecipeShortSerializer.Meta.fields),
+        many=True, allow_empty=False,
+    )
+
+    def to_internal_value(self, data):
+        recipes = data.get('recipes') if hasattr(data, 'get') else None
+        if (isinstance(recipes, list)
+                and len(recipes) > settings.MAX_PAGE_SIZE):
+            raise serializers.ValidationError({'recipes': (
+                f'Не больше {settings.MAX_PAGE_SIZE} рецептов за запрос'
+            )})
+        return super().to_internal_value(data)
+
+    def validate_recipes(self, data):
+        return list({recipe.pk: recipe for recipe in data}.values())
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -304,3 +452,110 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListExport
+        fields = (
+            'id', 'format', 'status', 'error',
+            'created_at', 'finished_at', 'expires_at', 'download_url',
+        )
+        read_only_fields = (
+            'id', 'status', 'error', 'created_at', 'finished_at',
+            'expires_at',
+        )
+
+    def get_download_url(self, obj):
+        if obj.status != ShoppingListExport.DONE:
+            return None
+        return reverse(
+            'shopping_list_export-download', args=[obj.pk],
+            request=self.context.get('request'),
+        )
+
+    def create(self, validated_data):
+        return enqueue_export(
+            self.context['request'].user,
+            validated_data.get('format', 'pdf'),
+        )
+
+
+class RecipeImportIngredientSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    measurement_unit = serializers.CharField(max_length=200)
+    amount = serializers.IntegerField(min_value=1)
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    '''
+    Строка импорта рецептов.
+
+    Теги задаются слагами, ингредиенты — названием и единицей
+    измерения. Они ищутся в словарях context['tags'] и
+    context['ingredients'], а не запросами к базе. Картинка
+    передаётся путём к уже загруженному в хранилище файлу или его
+    адресом, поэтому строки выгрузки /api/recipes/export/ тоже подходят.
+    Строки с путём к отсутствующему файлу отклоняются.
+    '''
+    name = serializers.CharField(max_length=200)
+    text = serializers.CharField()
+    cooking_time = serializers.IntegerField(min_value=1)
+    image = serializers.CharField(
+        max_length=Recipe._meta.get_field('image').max_length,
+    )
+    tags = serializers.ListField(allow_empty=False)
+    ingredients = RecipeImportIngredientSerializer(
+        many=True, allow_empty=False,
+    )
+
+    def validate_image(self, data):
+        if settings.MEDIA_URL in data:
+            data = data.split(settings.MEDIA_URL, 1)[1]
+        if data.startswith('/') or '..' in data.split('/'):
+            raise serializers.ValidationError(
+                'Укажите путь к файлу внутри хранилища'
+            )
+        if not Recipe._meta.get_field('image').storage.exists(data):
+            raise serializers.ValidationError('Файл не найден в хранилище')
+        return data
+
+    def validate_tags(self, data):
+        tags = self.context['tags']
+        data = [
+            tag.get('slug') if isinstance(tag, dict) else tag for tag in data
+        ]
+        unknown = [
+            slug for slug in data
+            if not isinstance(slug, str) or slug not in tags
+        ]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Неизвестные теги: {", ".join(map(str, unknown))}'
+            )
+        tag_ids = {tags[slug] for slug in data}
+        if len(tag_ids) != len(data):
+            raise serializers.ValidationError('Теги должны быть уникальными')
+        return tag_ids
+
+    def validate_ingredients(self, data):
+        ingredients = self.context['ingredients']
+        amounts = {}
+        unknown = []
+        for ingredient in data:
+            key = (ingredient['name'], ingredient['measurement_unit'])
+            if key not in ingredients:
+                unknown.append(f'{key[0]} ({key[1]})')
+                continue
+            amounts[ingredients[key]] = ingredient['amount']
+        if unknown:
+            raise serializers.ValidationError(
+                f'Неизвестные ингредиенты: {", ".join(unknown)}'
+            )
+        if len(amounts) != len(data):
+            raise serializers.ValidationError(
+                'Ингредиенты должны быть уникальными'
+            )
+        return amounts
@@ -0,0 +1,72 @@
+import os
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+FONT_NAME = 'ArialRegular'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'ArialRegular.ttf')
+FONT_SIZE = 16
+TITLE_POSITION = (200, 800)
+LINE_X = 100
+FIRST_LINE_Y = 780
+LINE_HEIGHT = 20
+BOTTOM_MARGIN = 40
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    '''Регистрирует шрифт один раз на процесс.'''
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def shopping_list_rows(user):
+    '''Строки списка покупок пользователя в порядке вывода.'''
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        ingredient_amount=F('total_amount'),
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def ingredient_lines(ingredients):
+    for index, ingredient in enumerate(ingredients, start=1):
+        yield (f'{index}. {ingredient["ingredient__name"]}'
+               f' {ingredient["ingredient_amount"]}'
+               f'{ingredient["ingredient__measurement_unit"]}.')
+
+
+def render_pdf(ingredients):
+    '''
+    Рисует список покупок в PDF, добавляя страницы по мере заполнения.
+
+    Документ пишется во временный файл, который остаётся в памяти до
+    SPOOL_MAX_SIZE и дальше сбрасывается на диск. Возвращает файл,
+    готовый к чтению, и признак того, что список не пуст.
+    '''
+    register_font()
+    buffer = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(buffer, pageCompression=1)
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    y_position = None
+    for text in ingredient_lines(ingredients):
+        if y_position is None:
+            pdf.drawString(*TITLE_POSITION, text='Что купить:')
+            y_position = FIRST_LINE_Y
+        elif y_position < BOTTOM_MARGIN:
+            pdf.showPage()
+            pdf.setFont(FONT_NAME, FONT_SIZE)
+            y_position = TITLE_POSITION[1]
+        pdf.drawString(LINE_X, y_position, text)
+        y_position -= LINE_HEIGHT
+    if y_position is None:
+        pdf.drawString(*TITLE_POSITION, text='Список покупок пуст!')
+    pdf.save()
+    buffer.seek(0)
+    return buffer, y_position is not None
@@ -2,13 +2,17 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CustomUserViewSet, IngredientViewSet,
-                    RecipeViewSet, TagViewSet)
+                    RecipeViewSet, ShoppingListExportViewSet, TagViewSet)
 
 router = DefaultRouter()
 router.register(r'recipes', RecipeViewSet, basename='recipe')
 router.register(r'ingredients', IngredientViewSet)
 router.register(r'tags', TagViewSet)
 router.register(r'users', CustomUserViewSet, basename='users')
+router.register(
+    r'shopping_list_exports', ShoppingListExportViewSet,
+    basename='shopping_list_export',
+)
 
 
 urlpatterns = [
@@ -1,32 +1,47 @@
-from io import BytesIO
+import json
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models.aggregates import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
 
+from .caching import (get_stats, is_process_local, recipe_detail_key,
+                      recipe_list_key, table_version, table_version_subqueries)
+from .decorators import cache_for_anonymous, conditional_get, make_etag
 from .filters import IngredientFilter, RecipeFilter
+from .ingredient_index import ingredient_index
 from .mixins import FavoriteAndShoppingCartActionsMixin
-from .pagination import CustomPagination
+from .pagination import CustomPagination, FeedPagination, RecipePagination
+from .parsers import JSONLinesParser
 from .permissions import ForRecipePermission
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from .recipe_import import import_recipes
+from .renderers import SHOPPING_LIST_RENDERERS, ShoppingListPDFRenderer
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingListExport, Tag)
+from recipes.signals import (defer_counters, defer_recipe_updates,
+                             defer_shopping_list_refresh)
 from .serializers import (FavoriteSerializer, FollowCreateSerializer,
                           FollowSerializer,
                           IngredientSerializer, RecipeCreateSerializer,
                           RecipeIngredientCreateSerializer, RecipeSerializer,
-                          ShoppingCartSerializer,
-                          TagSerializer)
+                          RecipeShortSerializer, ShoppingCartSerializer,
+                          ShoppingListExportSerializer, TagSerializer,
+                          parse_recipes_limit)
+from .shopping_list import render_pdf, shopping_list_rows
 from users.models import Follow
 
 User = get_user_model()
@@ -49,6 +64,7 @@ class CustomUserViewSet(UserViewSet):
         return self.unsubscribe_action(request, id)
 
     def subscribe_action(self, request, id):
+        parse_recipes_limit(request)
         user = self.request.user
         author = get_object_or_404(User, pk=id)
         serializer = FollowCreateSerializer(
@@ -56,17 +72,23 @@ class CustomUserViewSet(UserViewSet):
             data={'author': author.id, 'user': user.id},
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            FeedEntry.objects.backfill(user, author)
         serializer = FollowSerializer(author, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def unsubscribe_action(self, request, id):
         user = self.request.user
         author = get_object_or_404(User, pk=id)
-        subscription = Follow.objects.filter(author=author.id, user=user.id)
-        if not subscription:
+        subscription = Follow.objects.filter(
+            author=author.id, user=user.id,
+        ).first()
+        if subscription is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        subscription.delete()
+        with transaction.atomic():
+            subscription.delete()
+            FeedEntry.objects.prune(user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -76,13 +98,23 @@ class CustomUserViewSet(UserViewSet):
         serializer_class=FollowSerializer,
     )
     def subscriptions(self, request):
+        recipes_limit = parse_recipes_limit(request)
         user = self.request.user
         subscriptions_queryset = Follow.objects.filter(user=user)
         authors = subscriptions_queryset.values_list('author_id', flat=True)
-        users_queryset = User.objects.filter(pk__in=authors)
+        users_queryset = User.objects.filter(pk__in=authors).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by(*User._meta.ordering)
         paginated_queryset = self.paginate_queryset(users_queryset)
+        recipes_by_author = {}
+        for recipe in Recipe.objects.latest_per_author(
+            [author.pk for author in paginated_queryset], recipes_limit,
+        ).only(*RecipeShortSerializer.Meta.fields, 'author_id'):
+            recipes_by_author.setdefault(recipe.author_id, []).append(recipe)
         serializer = FollowSerializer(
-            paginated_queryset, many=True, context={'request': request},
+            paginated_queryset, many=True, context={
+                'request': request, 'recipes_by_author': recipes_by_author,
+            },
         )
         return self.get_paginated_response(serializer.data)
 
@@ -111,6 +143,17 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
 
+    def get_etag(self, request, *args, **kwargs):
+        return make_etag('tags', table_version(Tag), kwargs.get('pk')), None
+
+    @conditional_get('get_etag')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get('get_etag')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
@@ -119,15 +162,51 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    version = None
+
+    def get_version(self):
+        '''
+        Версия таблицы ингредиентов для ETag.
+
+        Без If-None-Match берётся версия индекса в памяти, с ним
+        сверяется с базой, чтобы не ответить 304 на устаревший ETag.
+        '''
+        if self.version is None:
+            self.version = ingredient_index.get_version(
+                check='HTTP_IF_NONE_MATCH' in self.request.META,
+            )
+        return self.version
+
+    def get_etag(self, request, *args, **kwargs):
+        return make_etag(
+            'ingredients', self.get_version(), kwargs.get('pk'),
+            request.query_params.get('name', ''),
+        ), None
+
+    @conditional_get('get_etag')
+    def list(self, request, *args, **kwargs):
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+        ))
+
+    @conditional_get('get_etag')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet,
                     FavoriteAndShoppingCartActionsMixin):
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     permission_classes = [ForRecipePermission]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read(self.request.user)
+        return Recipe.objects.all()
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
@@ -136,6 +215,55 @@ class RecipeViewSet(viewsets.ModelViewSet,
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic(), defer_recipe_updates(), \
+                defer_shopping_list_refresh(), defer_counters():
+            instance.delete()
+
+    def get_etag(self, request, pk=None):
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        tags_count, tags_updated_at = table_version_subqueries(Tag)
+        ingredients_count, ingredients_updated_at = (
+            table_version_subqueries(Ingredient)
+        )
+        recipe = Recipe.objects.with_user_flags(request.user).filter(
+            pk=pk,
+        ).annotate(
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=request.user.pk, author=OuterRef('author'),
+            )),
+            tags_count=tags_count,
+            tags_updated_at=tags_updated_at,
+            ingredients_count=ingredients_count,
+            ingredients_updated_at=ingredients_updated_at,
+        ).values(
+            'updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'author_is_subscribed', 'author__email', 'author__username',
+            'author__first_name', 'author__last_name', 'tags_count',
+            'tags_updated_at', 'ingredients_count', 'ingredients_updated_at',
+        ).first()
+        if recipe is None:
+            return None
+        return make_etag('recipe', pk, *recipe.values()), recipe['updated_at']
+
+    def get_list_cache_key(self, request, *args, **kwargs):
+        return recipe_list_key(request)
+
+    def get_detail_cache_key(self, request, pk=None):
+        return recipe_detail_key(request, pk)
+
+    @cache_for_anonymous('get_list_cache_key')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_get('get_etag')
+    @cache_for_anonymous('get_detail_cache_key')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -156,45 +284,209 @@ class RecipeViewSet(viewsets.ModelViewSet,
             request, pk, model
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request, model=Favorite):
+        return self.favorite_and_shopping_cart_batch(request, model)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request, model=ShoppingCart):
+        return self.favorite_and_shopping_cart_batch(request, model)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request, *args, **kwargs):
+        '''
+        Рецепты авторов из подписок, новые сверху.
+
+        Основная часть ленты читается из таймлайна пользователя, рецепты
+        авторов с большим числом подписчиков подмешиваются при чтении.
+        '''
+        user = request.user
+        positions = self.paginator.paginate_sources((
+            (FeedEntry.objects.filter(user=user), 'pub_date', 'recipe_id'),
+            (
+                Recipe.objects.filter(
+                    author__in=FeedEntry.objects.pull_author_ids(user),
+                ),
+                'pub_date', 'id',
+            ),
+        ), request)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in positions],
+        )
+        serializer = RecipeSerializer(
+            [recipes[recipe_id] for _, recipe_id in positions
+             if recipe_id in recipes],
+            many=True, context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        pagination_class=None,
+    )
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            self.export_lines(queryset), content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"'
+        )
+        return response
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[IsAdminUser],
+        pagination_class=None,
+    )
+    def cache_stats(self, request):
+        '''
+        Статистика кеша ответов для анонимных пользователей.
+
+        Счётчики читаются в процессе веб-сервера. Если кеш хранится
+        в памяти процесса, это счётчики только того воркера, который
+        ответил на запрос: об этом говорит process_local.
+        '''
+        return Response({**get_stats(), 'process_local': is_process_local()})
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='import',
+        permission_classes=[IsAdminUser],
+        parser_classes=[JSONLinesParser],
+    )
+    def bulk_import(self, request):
+        '''Импортирует рецепты из JSON Lines от имени администратора.'''
+        report = import_recipes(request.data, request.user)
+        return Response(report)
+
+    def export_lines(self, queryset):
+        '''Отдаёт рецепты построчно в JSON, читая базу частями.'''
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+        recipe_ids = queryset.values_list('pk', flat=True).iterator(
+            chunk_size=chunk_size,
+        )
+        chunk = []
+        for recipe_id in recipe_ids:
+            chunk.append(recipe_id)
+            if len(chunk) == chunk_size:
+                yield from self.export_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self.export_chunk(chunk)
+
+    def export_chunk(self, recipe_ids):
+        '''Рецепты части в порядке recipe_ids, то есть в порядке выгрузки.'''
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True, context=self.get_serializer_context(),
+        )
+        for recipe in serializer.data:
+            yield json.dumps(
+                recipe, cls=JSONEncoder, ensure_ascii=False,
+            ) + '\n'
+
     @action(
         methods=['get'],
         detail=False,
         permission_classes=[IsAuthenticated],
         pagination_class=None,
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
-    def download_shopping_cart(self, request):
-        pdfmetrics.registerFont(TTFont('ArialRegular', 'ArialRegular.ttf'))
-        buffer = BytesIO()
-        pdf = canvas.Canvas(buffer)
-        pdf.setFont('ArialRegular', 16)
-        ingredients_list = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit',
-        ).annotate(ingredient_amount=Sum('amount'))
-        if ingredients_list:
-            pdf.drawString(200, 800, text='Что купить:')
-            y_position = 780
-            for index, ingredient in enumerate(ingredients_list, start=1):
-                text = (f'{index}. {ingredient["ingredient__name"]}'
-                        f' {ingredient["ingredient_amount"]}'
-                        f'{ingredient["ingredient__measurement_unit"]}.')
-                pdf.drawString(100, y_position, text)
-                y_position -= 20
-            pdf.save()
-            buffer.seek(0)
-            response = FileResponse(
-                buffer, as_attachment=True, filename='shopping_cart.pdf',
-            )
-            return response
+    def download_shopping_cart(self, request, *args, **kwargs):
+        '''
+        Список покупок в формате, выбранном по ?format= или Accept.
 
-        pdf.drawString(200, 800, text='Список покупок пуст!')
-        pdf.save()
-        buffer.seek(0)
-        response = FileResponse(
-            buffer, as_attachment=False, filename='shopping_cart.pdf')
+        PDF остаётся форматом по умолчанию, CSV, текст и JSON
+        отдаются потоком прямо из выборки.
+        '''
+        ingredients_list = shopping_list_rows(request.user).iterator()
+        renderer = request.accepted_renderer
+        if isinstance(renderer, ShoppingListPDFRenderer):
+            buffer, has_ingredients = render_pdf(ingredients_list)
+            return FileResponse(
+                buffer, as_attachment=has_ingredients,
+                filename='shopping_cart.pdf',
+            )
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients_list),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
         return response
 
+    def handle_exception(self, exc):
+        if self.action == 'download_shopping_cart':
+            # Ошибки списка покупок отдаются в JSON, а не в формате файла.
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+
+class ShoppingListExportViewSet(mixins.CreateModelMixin,
+                                mixins.RetrieveModelMixin,
+                                viewsets.GenericViewSet):
+    '''
+    Фоновая выгрузка списка покупок.
+
+    POST ставит задание в очередь и сразу возвращает его id, файл
+    формирует отдельный процесс process_shopping_list_exports.
+    '''
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = '[0-9a-f-]{36}'
+
+    def get_queryset(self):
+        return ShoppingListExport.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = {
+            'Location': reverse(
+                'shopping_list_export-detail', args=[serializer.instance.pk],
+                request=request,
+            ),
+        }
+        return Response(
+            serializer.data, status=status.HTTP_202_ACCEPTED, headers=headers,
+        )
+
+    @action(methods=['get'], detail=True)
+    def download(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status != ShoppingListExport.DONE:
+            return Response(
+                {'errors': job.error or 'Выгрузка ещё не готова'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return FileResponse(
+            job.file.open('rb'), as_attachment=True,
+            filename=f'shopping_cart.{job.format}',
+        )
+
 
 class FavoriteViewSet(viewsets.ModelViewSet):
     queryset = Favorite.objects.all()
@@ -0,0 +1,476 @@
+'''
+Бюджеты запросов и задержки для всех эндпоинтов API.
+
+Каждый эндпоинт выполняется один раз под подсчётом SQL-запросов,
+после чего замеряется BENCHMARK_ITERATIONS раз. Количество запросов
+не должно превышать бюджет, p50/p95 задержки пишутся в файл
+BENCHMARK_RESULTS (по умолчанию benchmark-results.json).
+'''
+import json
+import os
+import statistics
+import time
+from collections import namedtuple
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.exports import enqueue_export, process_export
+from api.pagination import encode_cursor
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow
+
+from .conftest import IMAGE
+
+User = get_user_model()
+
+ITERATIONS = int(os.getenv('BENCHMARK_ITERATIONS', 20))
+PASSWORD = 'Benchmark-Password-1'
+
+Endpoint = namedtuple(
+    'Endpoint',
+    ('name', 'method', 'url', 'budget', 'status', 'client', 'data',
+     'prepare', 'undo', 'headers', 'content_type'),
+    defaults=(200, 'user', None, None, None, None, None),
+)
+
+
+class Context:
+    '''Объекты из тестовых данных, нужные для построения запросов.'''
+
+    def __init__(self, user):
+        self.user = user
+        self.token = Token.objects.get(user=user).key
+        self.own_recipe = Recipe.objects.filter(author=user).first()
+        self.recipe = Recipe.objects.exclude(author=user).exclude(
+            favorite__user=user,
+        ).exclude(shopping_cart__user=user).first()
+        self.author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user,
+        ).first()
+        self.batch = list(Recipe.objects.exclude(author=user).exclude(
+            favorite__user=user,
+        ).exclude(shopping_cart__user=user).values_list('id', flat=True)[:20])
+        self.followed = User.objects.filter(following__user=user).first()
+        self.tag = Tag.objects.first()
+        self.ingredient = Ingredient.objects.first()
+        oldest = Recipe.objects.order_by('pub_date', 'id')[10]
+        self.deep_cursor = encode_cursor(oldest.pub_date, oldest.pk)
+
+    def recipe_payload(self):
+        ingredients = Ingredient.objects.order_by('id')[:10]
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': IMAGE,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:2]),
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+
+
+def if_none_match(url):
+    def headers(ctx):
+        return {'HTTP_IF_NONE_MATCH': ctx.client.get(url(ctx))['ETag']}
+    return headers
+
+
+def restore_token(ctx):
+    Token.objects.get_or_create(user=ctx.user, key=ctx.token)
+
+
+def add_favorite(ctx):
+    Favorite.objects.get_or_create(user=ctx.user, recipe=ctx.recipe)
+
+
+def remove_favorite(ctx):
+    Favorite.objects.filter(user=ctx.user, recipe=ctx.recipe).delete()
+
+
+def add_to_cart(ctx):
+    ShoppingCart.objects.get_or_create(user=ctx.user, recipe=ctx.recipe)
+
+
+def remove_from_cart(ctx):
+    ShoppingCart.objects.filter(user=ctx.user, recipe=ctx.recipe).delete()
+
+
+def add_batch(model):
+    def prepare(ctx):
+        model.objects.add(ctx.user, ctx.batch)
+    return prepare
+
+
+def remove_batch(model):
+    def undo(ctx):
+        model.objects.filter(user=ctx.user, recipe__in=ctx.batch).delete()
+    return undo
+
+
+def follow(ctx):
+    Follow.objects.get_or_create(user=ctx.user, author=ctx.author)
+    FeedEntry.objects.backfill(ctx.user, ctx.author)
+
+
+def unfollow(ctx):
+    Follow.objects.filter(user=ctx.user, author=ctx.author).delete()
+    FeedEntry.objects.prune(ctx.user, ctx.author)
+
+
+def one_amount_changed(ctx):
+    recipe_ingredients = list(ctx.own_recipe.recipe_ingredients.order_by('id'))
+    recipe_ingredients[0].amount += 1
+    return {
+        'tags': list(ctx.own_recipe.tags.values_list('id', flat=True)),
+        'ingredients': [
+            {'id': recipe_ingredient.ingredient_id,
+             'amount': recipe_ingredient.amount}
+            for recipe_ingredient in recipe_ingredients
+        ],
+    }
+
+
+def delete_created_recipe(ctx):
+    Recipe.objects.filter(author=ctx.user, name='Новый рецепт').delete()
+
+
+def import_lines(ctx):
+    ingredients = Ingredient.objects.order_by('id')[:10]
+    line = json.dumps({
+        'name': 'Импортированный рецепт',
+        'text': 'Описание',
+        'cooking_time': 15,
+        'image': ctx.own_recipe.image.name,
+        'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+        'ingredients': [
+            {
+                'name': ingredient.name,
+                'measurement_unit': ingredient.measurement_unit,
+                'amount': 10,
+            }
+            for ingredient in ingredients
+        ],
+    }, ensure_ascii=False)
+    return '\n'.join([line] * 20).encode()
+
+
+def make_staff(ctx):
+    User.objects.filter(pk=ctx.user.pk).update(is_staff=True)
+
+
+def delete_imported_recipes(ctx):
+    Recipe.objects.filter(
+        author=ctx.user, name='Импортированный рецепт',
+    ).delete()
+    User.objects.filter(pk=ctx.user.pk).update(is_staff=False)
+
+
+def make_regular(ctx):
+    User.objects.filter(pk=ctx.user.pk).update(is_staff=False)
+
+
+def create_recipe_to_delete(ctx):
+    ctx.doomed = Recipe.objects.create(
+        author=ctx.user, name='Удаляемый рецепт', text='Описание',
+        cooking_time=1, image=ctx.own_recipe.image.name,
+    )
+
+
+def create_user_to_delete(ctx):
+    User.objects.filter(username='benchmark').delete()
+
+
+def finish_export(ctx):
+    ctx.export = process_export(enqueue_export(ctx.user, 'csv'))
+
+
+ENDPOINTS = (
+    Endpoint('api-root', 'get', lambda ctx: '/api/', 1),
+    Endpoint(
+        'token-login', 'post', lambda ctx: '/api/auth/token/login/', 3,
+        client='anon',
+        data=lambda ctx: {'email': ctx.user.email, 'password': PASSWORD},
+    ),
+    Endpoint(
+        'token-logout', 'post', lambda ctx: '/api/auth/token/logout/', 3,
+        status=204, undo=restore_token,
+    ),
+    Endpoint('users-list', 'get', lambda ctx: '/api/users/', 4),
+    Endpoint(
+        'users-search', 'get', lambda ctx: '/api/users/?search=user1', 4,
+    ),
+    Endpoint(
+        'users-create', 'post', lambda ctx: '/api/users/', 5, status=201,
+        client='anon',
+        data=lambda ctx: {
+            'email': 'benchmark@foodgram.ru', 'username': 'benchmark',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': PASSWORD,
+        },
+        undo=create_user_to_delete,
+    ),
+    Endpoint(
+        'users-detail', 'get', lambda ctx: f'/api/users/{ctx.author.id}/', 3,
+    ),
+    Endpoint('users-me', 'get', lambda ctx: '/api/users/me/', 2),
+    Endpoint(
+        'users-set-password', 'post', lambda ctx: '/api/users/set_password/',
+        3, status=204,
+        data=lambda ctx: {
+            'current_password': PASSWORD, 'new_password': PASSWORD,
+        },
+    ),
+    Endpoint(
+        'users-subscribe', 'post',
+        lambda ctx: f'/api/users/{ctx.author.id}/subscribe/', 14,
+        status=201, undo=unfollow,
+    ),
+    Endpoint(
+        'users-unsubscribe', 'delete',
+        lambda ctx: f'/api/users/{ctx.author.id}/subscribe/', 8,
+        status=204, prepare=follow,
+    ),
+    Endpoint(
+        'users-subscriptions', 'get',
+        lambda ctx: '/api/users/subscriptions/?recipes_limit=3', 4,
+    ),
+    Endpoint(
+        'users-subscriptions-all-recipes', 'get',
+        lambda ctx: '/api/users/subscriptions/', 4,
+    ),
+    Endpoint('tags-list', 'get', lambda ctx: '/api/tags/', 3),
+    Endpoint(
+        'tags-list-not-modified', 'get', lambda ctx: '/api/tags/', 2,
+        status=304, headers=if_none_match(lambda ctx: '/api/tags/'),
+    ),
+    Endpoint('tags-detail', 'get', lambda ctx: f'/api/tags/{ctx.tag.id}/', 3),
+    Endpoint('ingredients-list', 'get', lambda ctx: '/api/ingredients/', 3),
+    Endpoint(
+        'ingredients-search', 'get',
+        lambda ctx: '/api/ingredients/?name=ингредиент 1', 1,
+    ),
+    Endpoint(
+        'ingredients-detail', 'get',
+        lambda ctx: f'/api/ingredients/{ctx.ingredient.id}/', 2,
+    ),
+    Endpoint(
+        'recipes-list-anonymous', 'get', lambda ctx: '/api/recipes/', 5,
+        client='anon',
+    ),
+    Endpoint('recipes-list', 'get', lambda ctx: '/api/recipes/', 7),
+    Endpoint(
+        'recipes-list-limit-50', 'get', lambda ctx: '/api/recipes/?limit=50',
+        7,
+    ),
+    Endpoint(
+        'recipes-list-filtered', 'get',
+        lambda ctx: (
+            '/api/recipes/?tags=tag0&tags=tag1'
+            '&is_favorited=1&is_in_shopping_cart=0'
+        ),
+        9,
+    ),
+    Endpoint(
+        'recipes-search', 'get', lambda ctx: '/api/recipes/?name=рецепт 1',
+        6,
+    ),
+    Endpoint(
+        'recipes-list-popular', 'get',
+        lambda ctx: '/api/recipes/?ordering=popular', 7,
+    ),
+    Endpoint(
+        'recipes-list-cursor', 'get', lambda ctx: '/api/recipes/?cursor=', 6,
+    ),
+    Endpoint(
+        'recipes-list-cursor-deep', 'get',
+        lambda ctx: f'/api/recipes/?cursor={ctx.deep_cursor}', 6,
+    ),
+    Endpoint(
+        'recipes-list-over-max-page-size', 'get',
+        lambda ctx: '/api/recipes/?limit=100000', 7,
+    ),
+    Endpoint('recipes-feed', 'get', lambda ctx: '/api/recipes/feed/', 7),
+    Endpoint(
+        'recipes-feed-cursor', 'get',
+        lambda ctx: f'/api/recipes/feed/?cursor={ctx.deep_cursor}', 7,
+    ),
+    Endpoint('recipes-export', 'get', lambda ctx: '/api/recipes/export/', 7),
+    Endpoint(
+        'recipes-import', 'post', lambda ctx: '/api/recipes/import/', 30,
+        data=import_lines, content_type='application/x-ndjson',
+        prepare=make_staff, undo=delete_imported_recipes,
+    ),
+    Endpoint(
+        'recipes-cache-stats', 'get',
+        lambda ctx: '/api/recipes/cache_stats/', 1,
+        prepare=make_staff, undo=make_regular,
+    ),
+    Endpoint(
+        'recipes-detail', 'get',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/', 7,
+    ),
+    Endpoint(
+        'recipes-detail-anonymous', 'get',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/', 5, client='anon',
+    ),
+    Endpoint(
+        'recipes-detail-not-modified', 'get',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/', 2, status=304,
+        headers=if_none_match(lambda ctx: f'/api/recipes/{ctx.recipe.id}/'),
+    ),
+    Endpoint(
+        'recipes-create', 'post', lambda ctx: '/api/recipes/', 18,
+        status=201, data=lambda ctx: ctx.recipe_payload(),
+        undo=delete_created_recipe,
+    ),
+    Endpoint(
+        'recipes-update', 'patch',
+        lambda ctx: f'/api/recipes/{ctx.own_recipe.id}/', 28,
+        data=lambda ctx: ctx.recipe_payload(),
+    ),
+    Endpoint(
+        'recipes-update-one-amount', 'patch',
+        lambda ctx: f'/api/recipes/{ctx.own_recipe.id}/', 22,
+        data=one_amount_changed,
+    ),
+    Endpoint(
+        'recipes-delete', 'delete',
+        lambda ctx: f'/api/recipes/{ctx.doomed.id}/', 13, status=204,
+        prepare=create_recipe_to_delete,
+    ),
+    Endpoint(
+        'recipes-favorite-add', 'post',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/favorite/', 4,
+        status=201, undo=remove_favorite,
+    ),
+    Endpoint(
+        'recipes-favorite-remove', 'delete',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/favorite/', 3,
+        status=204, prepare=add_favorite,
+    ),
+    Endpoint(
+        'recipes-shopping-cart-add', 'post',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/shopping_cart/', 8,
+        status=201, undo=remove_from_cart,
+    ),
+    Endpoint(
+        'recipes-shopping-cart-remove', 'delete',
+        lambda ctx: f'/api/recipes/{ctx.recipe.id}/shopping_cart/', 7,
+        status=204, prepare=add_to_cart,
+    ),
+    Endpoint(
+        'recipes-favorite-batch-add', 'post',
+        lambda ctx: '/api/recipes/favorite/batch/', 4, status=201,
+        data=lambda ctx: {'recipes': ctx.batch}, undo=remove_batch(Favorite),
+    ),
+    Endpoint(
+        'recipes-favorite-batch-remove', 'delete',
+        lambda ctx: '/api/recipes/favorite/batch/', 4, status=204,
+        data=lambda ctx: {'recipes': ctx.batch}, prepare=add_batch(Favorite),
+    ),
+    Endpoint(
+        'recipes-shopping-cart-batch-add', 'post',
+        lambda ctx: '/api/recipes/shopping_cart/batch/', 8, status=201,
+        data=lambda ctx: {'recipes': ctx.batch},
+        undo=remove_batch(ShoppingCart),
+    ),
+    Endpoint(
+        'recipes-shopping-cart-batch-remove', 'delete',
+        lambda ctx: '/api/recipes/shopping_cart/batch/', 8, status=204,
+        data=lambda ctx: {'recipes': ctx.batch},
+        prepare=add_batch(ShoppingCart),
+    ),
+    Endpoint(
+        'recipes-download-shopping-cart', 'get',
+        lambda ctx: '/api/recipes/download_shopping_cart/', 2,
+    ),
+    Endpoint(
+        'recipes-download-shopping-cart-json', 'get',
+        lambda ctx: '/api/recipes/download_shopping_cart/?format=json', 2,
+    ),
+    Endpoint(
+        'recipes-download-shopping-cart-csv', 'get',
+        lambda ctx: '/api/recipes/download_shopping_cart/', 2,
+        headers=lambda ctx: {'HTTP_ACCEPT': 'text/csv'},
+    ),
+    Endpoint(
+        'recipes-download-shopping-cart-txt', 'get',
+        lambda ctx: '/api/recipes/download_shopping_cart/?format=txt', 2,
+    ),
+    Endpoint(
+        'shopping-list-exports-create', 'post',
+        lambda ctx: '/api/shopping_list_exports/', 4, status=202,
+        data=lambda ctx: {'format': 'pdf'},
+    ),
+    Endpoint(
+        'shopping-list-exports-detail', 'get',
+        lambda ctx: f'/api/shopping_list_exports/{ctx.export.pk}/', 2,
+        prepare=finish_export,
+    ),
+    Endpoint(
+        'shopping-list-exports-download', 'get',
+        lambda ctx: f'/api/shopping_list_exports/{ctx.export.pk}/download/',
+        2, prepare=finish_export,
+    ),
+)
+
+
+def percentile(timings, percent):
+    return statistics.quantiles(timings, n=100, method='inclusive')[
+        percent - 1
+    ]
+
+
+@pytest.mark.parametrize(
+    'endpoint', ENDPOINTS, ids=[endpoint.name for endpoint in ENDPOINTS],
+)
+def test_endpoint(endpoint, user, user_client, anon_client, results):
+    user.set_password(PASSWORD)
+    user.save()
+    ctx = Context(user)
+    client = user_client if endpoint.client == 'user' else anon_client
+    ctx.client = client
+
+    def call():
+        if endpoint.prepare:
+            endpoint.prepare(ctx)
+        data = endpoint.data(ctx) if endpoint.data else None
+        headers = endpoint.headers(ctx) if endpoint.headers else {}
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            encoding = (
+                {'content_type': endpoint.content_type}
+                if endpoint.content_type else {'format': 'json'}
+            )
+            response = getattr(client, endpoint.method)(
+                endpoint.url(ctx), data=data, **encoding, **headers,
+            )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if endpoint.undo:
+            endpoint.undo(ctx)
+        assert response.status_code == endpoint.status, (
+            getattr(response, 'data', response)
+        )
+        return len(queries), elapsed
+
+    queries, _ = call()
+    timings = [call()[1] * 1000 for _ in range(ITERATIONS)]
+    results[endpoint.name] = {
+        'queries': queries,
+        'budget': endpoint.budget,
+        'iterations': ITERATIONS,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+    assert queries <= endpoint.budget, (
+        f'{endpoint.name}: {queries} запросов при бюджете {endpoint.budget}'
+    )
@@ -0,0 +1,148 @@
+import base64
+import json
+import os
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+USERS_COUNT = 40
+TAGS_COUNT = 6
+INGREDIENTS_COUNT = 300
+RECIPES_PER_AUTHOR = 8
+INGREDIENTS_PER_RECIPE = 10
+FOLLOWS_PER_USER = 12
+FAVORITES_PER_USER = 20
+CART_PER_USER = 15
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD'
+    'hgGAWjR9awAAAABJRU5ErkJggg=='
+)
+IMAGE = 'data:image/png;base64,' + base64.b64encode(PNG).decode()
+
+RESULTS = {}
+
+
+def seed():
+    '''Наполняет базу данными, похожими на рабочие.'''
+    User.objects.bulk_create(
+        User(
+            username=f'user{index}', email=f'user{index}@foodgram.ru',
+            first_name=f'Имя{index}', last_name=f'Фамилия{index}',
+            password='!',
+        )
+        for index in range(USERS_COUNT)
+    )
+    users = list(User.objects.order_by('id'))
+    tags = [
+        Tag.objects.create(
+            name=f'Тег {index}', color=f'#0000{index:02d}',
+            slug=f'tag{index}',
+        )
+        for index in range(TAGS_COUNT)
+    ]
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+        for index in range(INGREDIENTS_COUNT)
+    )
+    ingredients = list(Ingredient.objects.order_by('id'))
+    image = None
+    for author_index, author in enumerate(users):
+        for index in range(RECIPES_PER_AUTHOR):
+            number = author_index * RECIPES_PER_AUTHOR + index
+            recipe = Recipe(
+                name=f'Рецепт {number}', text='Описание рецепта',
+                cooking_time=10 + index, author=author, image=image,
+            )
+            if image is None:
+                recipe.image.save(
+                    'seed.png', ContentFile(PNG), save=False,
+                )
+                image = recipe.image.name
+            recipe.save()
+            recipe.tags.set(tags[index % TAGS_COUNT:][:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredients[
+                        (number + offset * 7) % INGREDIENTS_COUNT
+                    ],
+                    amount=offset + 1,
+                )
+                for offset in range(INGREDIENTS_PER_RECIPE)
+            )
+    recipes = list(Recipe.objects.order_by('id'))
+    for user_index, user in enumerate(users):
+        Follow.objects.bulk_create(
+            Follow(user=user, author=users[
+                (user_index + offset) % USERS_COUNT
+            ])
+            for offset in range(1, FOLLOWS_PER_USER + 1)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipes[
+                (user_index * 3 + offset) % len(recipes)
+            ])
+            for offset in range(FAVORITES_PER_USER)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipes[
+                (user_index * 5 + offset) % len(recipes)
+            ])
+            for offset in range(CART_PER_USER)
+        )
+    ShoppingListItem.objects.refresh([user.pk for user in users])
+    Recipe.objects.refresh_favorites_count()
+    Recipe.objects.refresh_authors_recipes_count()
+    Follow.objects.refresh_followers_count()
+    for follow in Follow.objects.select_related('user', 'author'):
+        FeedEntry.objects.backfill(follow.user, follow.author)
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker, tmp_path_factory):
+    from django.conf import settings
+    settings.MEDIA_ROOT = str(tmp_path_factory.mktemp('media'))
+    with django_db_blocker.unblock():
+        seed()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.order_by('id').first()
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.fixture
+def results():
+    return RESULTS
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not RESULTS:
+        return
+    path = os.getenv('BENCHMARK_RESULTS', 'benchmark-results.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(RESULTS, file, ensure_ascii=False, indent=2, sort_keys=True)
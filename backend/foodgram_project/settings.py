@@ -74,6 +74,17 @@ DATABASES = {
     }
 }
 
+# Кеш ответов для анонимных пользователей включается только с общим
+# бэкендом (база данных, Memcached), кеш в памяти процесса его отключает.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +113,42 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
 }
 
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 500))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+INGREDIENT_VERSION_CHECK_INTERVAL = int(
+    os.getenv('INGREDIENT_VERSION_CHECK_INTERVAL', 5)
+)
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 600))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 500))
+
+EXPORT_WORKER_POLL_INTERVAL = float(
+    os.getenv('EXPORT_WORKER_POLL_INTERVAL', 1)
+)
+
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', 300))
+
+EXPORT_TTL = int(os.getenv('EXPORT_TTL', 24 * 60 * 60))
+
+EXPORT_CLEANUP_INTERVAL = int(os.getenv('EXPORT_CLEANUP_INTERVAL', 60 * 60))
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
 
 DJOSER = {
     'SERIALIZERS': {
@@ -1,15 +1,35 @@
 from django.contrib import admin
+from import_export import resources
 from import_export.admin import ImportExportMixin
 
-from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .models import (Ingredient, Recipe, RecipeIngredient, ShoppingListExport,
+                     ShoppingListItem, Tag)
+
+
+class IngredientResource(resources.ModelResource):
+
+    class Meta:
+        model = Ingredient
+        fields = ('name', 'measurement_unit')
+        import_id_fields = ('name', 'measurement_unit')
 
 
 class IngredientAdmin(ImportExportMixin, admin.ModelAdmin):
+    resource_class = IngredientResource
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
 
 
+class ShoppingListExportAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'user', 'format', 'status', 'created_at', 'expires_at',
+    )
+    list_filter = ('status', 'format')
+
+
 admin.site.register(Tag)
 admin.site.register(Recipe)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(RecipeIngredient)
+admin.site.register(ShoppingListItem)
+admin.site.register(ShoppingListExport, ShoppingListExportAdmin)
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import Recipe, image_variants_changed
+
+logger = logging.getLogger(__name__)
+
+# Имя копии: (размер, обрезать ли под размер). Без обрезки картинка
+# только уменьшается, сохраняя пропорции.
+VARIANTS = {
+    'thumbnail': ((160, 160), True),
+    'card': ((600, 400), True),
+    'full': ((1600, 1600), False),
+}
+
+if features.check('webp'):
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'WEBP', 'webp'
+else:
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'JPEG', 'jpg'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, variant):
+    '''
+    Имя файла копии рядом с оригиналом.
+
+    Хранилище может сохранить файл под другим именем, настоящее
+    имя записывается в Recipe.image_variants.
+    '''
+    return f'{os.path.splitext(name)[0]}.{variant}.{VARIANT_EXTENSION}'
+
+
+def render_variant(image, size, crop):
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    if VARIANT_FORMAT == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, VARIANT_FORMAT, quality=settings.IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage):
+    '''
+    Создаёт копии картинки всех размеров из VARIANTS.
+
+    Возвращает словарь {'source': name, имя копии: путь к файлу}.
+    '''
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    variants = {'source': name}
+    for variant, (size, crop) in VARIANTS.items():
+        variants[variant] = storage.save(
+            variant_name(name, variant),
+            ContentFile(render_variant(image, size, crop)),
+        )
+    return variants
+
+
+def build_recipe_variants(recipe_id, force=False):
+    '''
+    Создаёт копии картинки рецепта, если они устарели.
+
+    Копии записываются, только если картинка рецепта за время их
+    создания не сменилась. Иначе созданные файлы удаляются, если
+    на ту же картинку не ссылается другой рецепт.
+    '''
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'image', 'image_variants',
+    ).first()
+    if recipe is None or not recipe.image:
+        return False
+    source = recipe.image.name
+    if not force and recipe.image_variants.get('source') == source:
+        return False
+    storage = recipe.image.storage
+    try:
+        variants = generate_variants(source, storage)
+    except (OSError, ValueError):
+        logger.exception(
+            'Не удалось создать копии картинки рецепта %s', recipe_id,
+        )
+        return False
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_variants=variants, updated_at=timezone.now(),
+    )
+    if not updated:
+        if not Recipe.objects.filter(image=source).exists():
+            for variant in VARIANTS:
+                storage.delete(variants[variant])
+        return False
+    image_variants_changed.send(sender=Recipe, recipe_id=recipe_id)
+    return True
+
+
+def build_in_thread(recipe_id, force=False):
+    try:
+        return build_recipe_variants(recipe_id, force)
+    finally:
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+    return _executor
+
+
+def schedule_variants(*recipe_ids):
+    '''
+    Ставит создание копий в пул потоков после фиксации транзакции.
+
+    Число потоков ограничено IMAGE_VARIANT_WORKERS; при нуле копии
+    создаются сразу в текущем потоке.
+    '''
+    def submit():
+        for recipe_id in recipe_ids:
+            if settings.IMAGE_VARIANT_WORKERS:
+                get_executor().submit(build_in_thread, recipe_id)
+            else:
+                build_recipe_variants(recipe_id)
+    transaction.on_commit(submit)
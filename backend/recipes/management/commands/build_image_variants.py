@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_in_thread
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт уменьшенные копии картинок рецептов, у которых их нет '
+        'или они относятся к прежней картинке.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=max(settings.IMAGE_VARIANT_WORKERS, 1),
+            help='Сколько картинок обрабатывать параллельно.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии всех картинок.',
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        recipe_ids = [
+            recipe_id
+            for recipe_id, image, variants in Recipe.objects.exclude(
+                image='',
+            ).values_list('id', 'image', 'image_variants').iterator()
+            if force or variants.get('source') != image
+        ]
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            built = sum(executor.map(
+                lambda recipe_id: build_in_thread(recipe_id, force),
+                recipe_ids,
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии созданы для {built} из {len(recipe_ids)} рецептов'
+        ))
@@ -0,0 +1,105 @@
+import posixpath
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+HASHED_NAME = re.compile(r'[0-9a-f]{64}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок рецептов, на которые не ссылается '
+        'ни один рецепт, ни их уменьшенные копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help=(
+                'Не трогать файлы моложе этого числа секунд: они могут '
+                'принадлежать ещё не сохранённому рецепту.'
+            ),
+        )
+        parser.add_argument(
+            '--rehash', action='store_true',
+            help=(
+                'Сначала переименовать старые картинки по хешу содержимого, '
+                'чтобы одинаковые файлы хранились один раз.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        if options['rehash'] and not options['dry_run']:
+            self.rehash(storage)
+        referenced = set()
+        for image, variants in Recipe.objects.values_list(
+            'image', 'image_variants',
+        ).iterator():
+            referenced.add(image)
+            referenced.update(variants.values())
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        removed = freed = 0
+        for name, size in self.orphans(
+            storage, field.upload_to, referenced, cutoff,
+        ):
+            freed += size
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {removed}, {freed / 1024 / 1024:.1f} МБ'
+        ))
+
+    def orphans(self, storage, directory, referenced, cutoff):
+        '''Файлы каталога без ссылок, изменённые раньше cutoff, и их размер.'''
+        try:
+            _, filenames = storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            name = posixpath.join(directory, filename)
+            if name in referenced:
+                continue
+            try:
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+                yield name, storage.size(name)
+            except FileNotFoundError:
+                continue
+
+    def rehash(self, storage):
+        '''Переименовывает картинки рецептов, сохранённые не по хешу.'''
+        renamed = 0
+        for recipe in Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants',
+        ).iterator():
+            name = recipe.image.name
+            stem = posixpath.splitext(posixpath.basename(name))[0]
+            if HASHED_NAME.fullmatch(stem):
+                continue
+            if not storage.exists(name):
+                self.stderr.write(f'Рецепт {recipe.pk}: нет файла {name}')
+                continue
+            with storage.open(name) as file:
+                hashed = storage.save(name, file)
+            if recipe.image_variants.get('source') == name:
+                recipe.image_variants['source'] = hashed
+            recipe.image.name = hashed
+            recipe.save(
+                update_fields=['image', 'image_variants', 'updated_at'],
+            )
+            renamed += 1
+        self.stdout.write(f'Переименовано картинок: {renamed}')
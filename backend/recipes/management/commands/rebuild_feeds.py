@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Дополняет ленты подписок недостающими рецептами, например '
+        'после того как у автора стало меньше FEED_FANOUT_LIMIT '
+        'подписчиков.'
+    )
+
+    def handle(self, *args, **options):
+        before = FeedEntry.objects.count()
+        for follow in Follow.objects.select_related(
+            'user', 'author',
+        ).iterator():
+            FeedEntry.objects.backfill(follow.user, follow.author)
+        self.stdout.write(
+            f'Добавлено записей: {FeedEntry.objects.count() - before}'
+        )
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу списков покупок по корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.totals().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'total_amount',
+            ).iterator()
+        }
+        drifted = {
+            key[0] for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        self.stdout.write(f'Пользователей с расхождениями: {len(drifted)}')
+        if options['check'] or not drifted:
+            return
+        ShoppingListItem.objects.refresh(sorted(drifted))
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from recipes.models import Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного у рецептов, количества рецептов '
+        'и подписчиков у авторов с таблицами и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        drifted_recipes = list(Recipe.objects.annotate(
+            actual=Count('favorite'),
+        ).exclude(favorites_count=F('actual')).values_list('id', flat=True))
+        drifted_authors = list(User.objects.annotate(
+            actual=Count('recipes'),
+        ).exclude(recipes_count=F('actual')).values_list('id', flat=True))
+        drifted_followed = list(User.objects.annotate(
+            actual=Count('following'),
+        ).exclude(followers_count=F('actual')).values_list('id', flat=True))
+        self.stdout.write(
+            f'Рецептов с расхождениями: {len(drifted_recipes)}, '
+            f'авторов с расхождениями: {len(drifted_authors)}, '
+            f'расхождений в подписчиках: {len(drifted_followed)}'
+        )
+        if options['check'] or not (
+            drifted_recipes or drifted_authors or drifted_followed
+        ):
+            return
+        Recipe.objects.filter(
+            pk__in=drifted_recipes,
+        ).refresh_favorites_count()
+        Recipe.objects.refresh_authors_recipes_count(drifted_authors)
+        Follow.objects.refresh_followers_count(drifted_followed)
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
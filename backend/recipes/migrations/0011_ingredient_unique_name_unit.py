@@ -0,0 +1,54 @@
+# Generated by Django 3.2.3 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit',
+    ).annotate(
+        keep=models.Min('id'), count=models.Count('id'),
+    ).filter(count__gt=1).order_by()
+    for group in duplicates.iterator():
+        keep = group['keep']
+        extra = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(pk=keep).values_list('pk', flat=True))
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe', 'amount'),
+            (ShoppingListItem, 'user', 'total_amount'),
+        ):
+            for row in model.objects.filter(ingredient__in=extra):
+                kept = model.objects.filter(**{
+                    owner: getattr(row, f'{owner}_id'), 'ingredient': keep,
+                }).first()
+                if kept is None:
+                    row.ingredient_id = keep
+                    row.save(update_fields=['ingredient'])
+                    continue
+                setattr(kept, amount, getattr(kept, amount) + getattr(
+                    row, amount,
+                ))
+                kept.save(update_fields=[amount])
+                row.delete()
+        Ingredient.objects.filter(pk__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
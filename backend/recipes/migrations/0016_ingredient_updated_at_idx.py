@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_tag_ingredient_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['updated_at'], name='ingredient_updated_at_idx'),
+        ),
+    ]
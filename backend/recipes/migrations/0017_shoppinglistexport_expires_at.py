@@ -0,0 +1,32 @@
+# Generated by Django 3.2.3 on 2026-10-18 08:57
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_expires_at(apps, schema_editor):
+    ShoppingListExport = apps.get_model('recipes', 'ShoppingListExport')
+    ShoppingListExport.objects.filter(finished_at__isnull=False).update(
+        expires_at=models.ExpressionWrapper(
+            models.F('finished_at') + timedelta(seconds=settings.EXPORT_TTL),
+            output_field=models.DateTimeField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_ingredient_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglistexport',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата удаления'),
+        ),
+        migrations.RunPython(fill_expires_at, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,126 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+from django.dispatch import Signal
+from django.utils import timezone
+
+from users.models import Follow
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
+# Счётчики избранного изменились запросом UPDATE, без сигналов модели.
+favorites_count_changed = Signal()
+# Копии картинки рецепта recipe_id записаны запросом UPDATE.
+image_variants_changed = Signal()
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        '''Добавляет признаки is_favorited и is_in_shopping_cart.'''
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField(),
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+        )
+
+    def for_read(self, user):
+        '''Набор рецептов для чтения без дополнительных запросов на объект.'''
+        return self.with_user_flags(user).select_related(
+            'author',
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient',
+                ),
+            ),
+        )
+
+    def latest_per_author(self, author_ids, limit=None):
+        '''
+        Последние рецепты каждого из авторов одним запросом.
+
+        Если задан limit, у каждого автора остаётся не больше limit
+        рецептов: номер рецепта внутри автора считается оконной функцией
+        ROW_NUMBER() OVER (PARTITION BY author_id ...).
+        '''
+        recipes = self.filter(author__in=author_ids)
+        if limit is None:
+            return recipes
+        ranked = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.row_number <= %s',
+            (*params, limit),
+        ))
+
+    def popular(self):
+        '''Рецепты по убыванию числа добавлений в избранное.'''
+        return self.order_by('-favorites_count', *Recipe._meta.ordering)
+
+    def refresh_favorites_count(self):
+        '''Пересчитывает Recipe.favorites_count по таблице избранного.'''
+        updated = self.update(favorites_count=Coalesce(
+            Subquery(
+                Favorite.objects.filter(recipe=OuterRef('pk')).order_by(
+                ).values('recipe').annotate(total=Count('pk')).values('total'),
+            ),
+            0,
+        ))
+        favorites_count_changed.send(sender=self.model)
+        return updated
+
+    def refresh_authors_recipes_count(self, author_ids=None):
+        '''Пересчитывает User.recipes_count у авторов, по умолчанию у всех.'''
+        authors = User.objects.all()
+        if author_ids is not None:
+            authors = authors.filter(pk__in=author_ids)
+        return authors.update(recipes_count=Coalesce(
+            Subquery(
+                self.model.objects.filter(author=OuterRef('pk')).order_by(
+                ).values('author').annotate(total=Count('pk')).values('total'),
+            ),
+            0,
+        ))
+
 
 class Recipe(models.Model):
     '''Модель рецепта.'''
     name = models.CharField(max_length=200, verbose_name='Название рецепта')
     image = models.ImageField(upload_to='recipes/images',
+                              storage=ContentAddressedStorage(),
                               verbose_name='Фотография рецепта')
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Уменьшенные копии фотографии',
+    )
     text = models.TextField(verbose_name='Описание рецепта')
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время приготовления в минутах',
@@ -24,18 +135,38 @@ class Recipe(models.Model):
         verbose_name='Дата публикации рецепта',
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения рецепта',
+    )
     tags = models.ManyToManyField(
         'Tag', related_name='recipes', verbose_name='Теги рецепта',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Сколько раз добавлен в избранное',
+    )
     ingredients = models.ManyToManyField(
         'Ingredient', related_name='ingredients',
         through='RecipeIngredient', verbose_name='Ингредиенты рецепта',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -49,6 +180,9 @@ class Tag(models.Model):
                              null=True, verbose_name='Цвет тега')
     slug = models.SlugField(max_length=200, null=True,
                             unique=True, verbose_name='Уникальный слаг')
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения тега',
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -64,10 +198,24 @@ class Ingredient(models.Model):
                             verbose_name='Название ингредиента')
     measurement_unit = models.CharField(max_length=200,
                                         verbose_name='Единица измерения')
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения ингредиента',
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(
+                fields=['updated_at'], name='ingredient_updated_at_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit',
+            ),
+        ]
 
     def __str__(self):
         return self.name + ' ' + self.measurement_unit
@@ -104,6 +252,103 @@ class RecipeIngredient(models.Model):
         return f'{self.recipe.name} : {self.ingredient.name} {self.amount}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    '''Связи пользователя с рецептами: избранное и корзина покупок.'''
+
+    def add(self, user, recipe_ids):
+        '''
+        Добавляет рецепты одним INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+
+        Уже добавленные и несуществующие рецепты пропускаются, сигналы
+        post_save не отправляются. Возвращает число добавленных записей.
+        '''
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return 0
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        columns = {
+            name: quote(meta.get_field(name).column)
+            for name in ('user', 'recipe', 'pub_date')
+        }
+        sql = (
+            'INSERT INTO {table} ({user}, {recipe}, {pub_date}) '
+            'SELECT %s, {id}, %s FROM {recipes} WHERE {id} IN ({ids}) '
+            'ON CONFLICT ({user}, {recipe}) DO NOTHING'
+        ).format(
+            table=quote(meta.db_table), recipes=quote(Recipe._meta.db_table),
+            id=quote(Recipe._meta.pk.column),
+            ids=', '.join(['%s'] * len(recipe_ids)), **columns,
+        )
+        pub_date = meta.get_field('pub_date').get_db_prep_value(
+            timezone.now(), connection,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, pub_date, *recipe_ids])
+            return cursor.rowcount
+
+    def remove(self, user, recipe_ids):
+        '''
+        Удаляет рецепты одним DELETE, возвращает число удалённых записей.
+
+        Сигналы post_delete не отправляются, счётчики и списки покупок
+        пересчитывают наследники.
+        '''
+        return self.filter(
+            user=user, recipe__in=recipe_ids,
+        )._raw_delete(self.db)
+
+
+class FavoriteQuerySet(UserRecipeQuerySet):
+
+    def add(self, user, recipe_ids):
+        '''Добавляет рецепты и пересчитывает их счётчики избранного.'''
+        with transaction.atomic(savepoint=False):
+            added = super().add(user, recipe_ids)
+            if added:
+                self.refresh_favorites_count(recipe_ids)
+        return added
+
+    def remove(self, user, recipe_ids):
+        '''Удаляет рецепты и пересчитывает их счётчики избранного.'''
+        with transaction.atomic(savepoint=False):
+            removed = super().remove(user, recipe_ids)
+            if removed:
+                self.refresh_favorites_count(recipe_ids)
+        return removed
+
+    def refresh_favorites_count(self, recipe_ids):
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_favorites_count()
+
+
+class ShoppingCartQuerySet(UserRecipeQuerySet):
+
+    def add(self, user, recipe_ids):
+        '''Добавляет рецепты и один раз пересчитывает список покупок.'''
+        with transaction.atomic(savepoint=False):
+            added = super().add(user, recipe_ids)
+            if added:
+                self.refresh_shopping_list(user, recipe_ids)
+        return added
+
+    def remove(self, user, recipe_ids):
+        '''Удаляет рецепты и один раз пересчитывает список покупок.'''
+        with transaction.atomic(savepoint=False):
+            removed = super().remove(user, recipe_ids)
+            if removed:
+                self.refresh_shopping_list(user, recipe_ids)
+        return removed
+
+    def refresh_shopping_list(self, user, recipe_ids):
+        ShoppingListItem.objects.refresh(
+            [user.pk],
+            RecipeIngredient.objects.filter(
+                recipe__in=recipe_ids,
+            ).values_list('ingredient', flat=True).distinct(),
+        )
+
+
 class Favorite(models.Model):
     '''
     Модель избранных рецептов.
@@ -122,6 +367,8 @@ class Favorite(models.Model):
         db_index=True,
     )
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
@@ -153,6 +400,8 @@ class ShoppingCart(models.Model):
         db_index=True,
     )
 
+    objects = ShoppingCartQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
@@ -166,3 +415,319 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список покупок'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def totals(self, user_ids=None, ingredient_ids=None):
+        '''Суммы ингредиентов в списках покупок, посчитанные по корзинам.'''
+        if user_ids is None:
+            recipe_ingredients = RecipeIngredient.objects.filter(
+                recipe__shopping_cart__isnull=False,
+            )
+        else:
+            recipe_ingredients = RecipeIngredient.objects.filter(
+                recipe__shopping_cart__user__in=user_ids,
+            )
+        if ingredient_ids is not None:
+            recipe_ingredients = recipe_ingredients.filter(
+                ingredient__in=ingredient_ids,
+            )
+        return recipe_ingredients.values_list(
+            'recipe__shopping_cart__user', 'ingredient',
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+    def refresh(self, user_ids, ingredient_ids=None):
+        '''
+        Пересчитывает строки списков покупок пользователей.
+
+        Если переданы ingredient_ids, пересчитываются только эти
+        ингредиенты. Работает в текущей транзакции.
+        '''
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic(savepoint=False):
+            list(User.objects.select_for_update().filter(
+                pk__in=user_ids,
+            ).values_list('pk'))
+            items = self.filter(user__in=user_ids)
+            if ingredient_ids is not None:
+                ingredient_ids = list(ingredient_ids)
+                items = items.filter(ingredient__in=ingredient_ids)
+            items.delete()
+            self.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    total_amount=total_amount,
+                )
+                for user_id, ingredient_id, total_amount in self.totals(
+                    user_ids, ingredient_ids,
+                )
+            )
+
+    def refresh_recipe(self, recipe_id, ingredient_ids=None):
+        '''Пересчитывает списки всех, у кого рецепт в корзине.'''
+        self.refresh(
+            ShoppingCart.objects.filter(recipe=recipe_id).values_list(
+                'user', flat=True,
+            ),
+            ingredient_ids,
+        )
+
+
+class ShoppingListItem(models.Model):
+    '''Модель суммарного количества ингредиента в списке покупок.'''
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list_items', verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items', verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Суммарное количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.total_amount}'
+
+
+class ShoppingListExportQuerySet(models.QuerySet):
+
+    def claim(self, timeout):
+        '''
+        Забирает из очереди одно задание и помечает его как выполняемое.
+
+        Берутся ожидающие задания и задания, зависшие дольше timeout
+        секунд. Заблокированные другим обработчиком строки пропускаются.
+        '''
+        now = timezone.now()
+        with transaction.atomic():
+            job = self.select_for_update(skip_locked=True).filter(
+                Q(status=ShoppingListExport.PENDING)
+                | Q(
+                    status=ShoppingListExport.RUNNING,
+                    started_at__lt=now - timedelta(seconds=timeout),
+                )
+            ).order_by('created_at').first()
+            if job is None:
+                return None
+            job.status = ShoppingListExport.RUNNING
+            job.started_at = now
+            job.save(update_fields=['status', 'started_at'])
+        return job
+
+    def delete_expired(self):
+        '''
+        Удаляет выгрузки с истёкшим сроком хранения вместе с файлами.
+
+        Одинаковые выгрузки ссылаются на один файл, поэтому файл
+        удаляется, только если на него не ссылается ни одна оставшаяся
+        выгрузка. Возвращает число удалённых выгрузок.
+        '''
+        expired = self.filter(expires_at__lte=timezone.now())
+        files = set(expired.exclude(file='').values_list('file', flat=True))
+        deleted, _ = expired.delete()
+        files -= set(ShoppingListExport.objects.filter(
+            file__in=files,
+        ).values_list('file', flat=True))
+        storage = self.model._meta.get_field('file').storage
+        for name in files:
+            storage.delete(name)
+        return deleted
+
+
+class ShoppingListExport(models.Model):
+    '''Модель задания на выгрузку списка покупок в файл.'''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    FORMAT_CHOICES = (
+        ('pdf', 'PDF'),
+        ('json', 'JSON'),
+        ('csv', 'CSV'),
+        ('txt', 'Текст'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list_exports', verbose_name='Пользователь',
+    )
+    format = models.CharField(
+        max_length=4, choices=FORMAT_CHOICES, default='pdf',
+        verbose_name='Формат',
+    )
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=PENDING,
+        verbose_name='Статус',
+    )
+    cart_hash = models.CharField(
+        max_length=64, verbose_name='Хеш содержимого списка покупок',
+    )
+    file = models.FileField(
+        upload_to='shopping_lists/', blank=True, verbose_name='Файл',
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Дата создания',
+    )
+    started_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Дата начала обработки',
+    )
+    finished_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Дата завершения',
+    )
+    expires_at = models.DateTimeField(
+        null=True, blank=True, db_index=True,
+        verbose_name='Дата удаления',
+    )
+
+    objects = ShoppingListExportQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(
+                fields=['status', 'created_at'],
+                name='export_status_created_idx',
+            ),
+            models.Index(
+                fields=['cart_hash', 'format', 'status'],
+                name='export_cart_hash_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.format} {self.status}'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+
+    def pull_author_ids(self, user):
+        '''
+        Авторы из подписок пользователя, рецепты которых читаются напрямую.
+
+        Это авторы, у которых подписчиков больше FEED_FANOUT_LIMIT:
+        их рецепты не рассылаются по лентам, а подмешиваются при чтении.
+        Число подписчиков берётся из счётчика User.followers_count.
+        '''
+        return Follow.objects.filter(
+            user=user, author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author', flat=True)
+
+    def fan_out(self, *recipes):
+        '''
+        Добавляет новые рецепты в ленты подписчиков их авторов.
+
+        Подписчики читаются одним запросом на автора. Если их больше
+        FEED_FANOUT_LIMIT, рассылка не делается: такой автор читается
+        в ленты напрямую.
+        '''
+        by_author = {}
+        for recipe in recipes:
+            by_author.setdefault(recipe.author_id, []).append(recipe)
+        for author_id, author_recipes in by_author.items():
+            followers = list(Follow.objects.filter(
+                author=author_id,
+                author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            ).values_list('user', flat=True))
+            if not followers:
+                continue
+            self.bulk_create(
+                (
+                    FeedEntry(
+                        user_id=user_id, recipe_id=recipe.pk,
+                        author_id=author_id, pub_date=recipe.pub_date,
+                    )
+                    for recipe in author_recipes
+                    for user_id in followers
+                ),
+                batch_size=1000, ignore_conflicts=True,
+            )
+
+    def backfill(self, user, author):
+        '''Добавляет в ленту последние рецепты автора после подписки.'''
+        recipes = Recipe.objects.filter(
+            author=author,
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+        self.bulk_create(
+            (
+                FeedEntry(
+                    user=user, recipe_id=recipe_id, author=author,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=1000, ignore_conflicts=True,
+        )
+
+    def prune(self, user, author):
+        '''Убирает рецепты автора из ленты после отписки.'''
+        return self.filter(user=user, author=author).delete()
+
+
+class FeedEntry(models.Model):
+    '''Модель записи в ленте подписок пользователя.'''
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='feed_entries', verbose_name='Читатель ленты',
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='feed_entries', verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='+', verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации рецепта')
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        ordering = ('-pub_date', '-recipe_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
@@ -0,0 +1,252 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Follow
+
+from .images import schedule_variants
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem, User, favorites_count_changed)
+
+_pending = threading.local()
+
+
+def get_pending(name):
+    '''Накопитель отложенной работы name или None вне блока defer_*.'''
+    return getattr(_pending, name, None)
+
+
+@contextmanager
+def deferred(name, factory, flush):
+    '''
+    Общая часть блоков defer_*.
+
+    Внутри блока сигналы складывают работу в накопитель name,
+    созданный factory(); на выходе flush(накопитель) выполняет её
+    разом. Вложенный блок с тем же name работает на внешний.
+    '''
+    if get_pending(name) is not None:
+        yield
+        return
+    setattr(_pending, name, factory())
+    try:
+        yield
+        pending = get_pending(name)
+    finally:
+        setattr(_pending, name, None)
+    flush(pending)
+
+
+def touch_recipe(recipe_id):
+    pending = get_pending('recipes')
+    if pending is None:
+        Recipe.objects.filter(pk=recipe_id).update(updated_at=timezone.now())
+    else:
+        pending.setdefault(recipe_id, set())
+
+
+def flush_recipe_updates(pending):
+    if pending:
+        Recipe.objects.filter(pk__in=pending).update(
+            updated_at=timezone.now(),
+        )
+    for recipe_id, ingredient_ids in pending.items():
+        if ingredient_ids:
+            ShoppingListItem.objects.refresh_recipe(recipe_id, ingredient_ids)
+
+
+def defer_recipe_updates():
+    '''
+    Откладывает отметку об изменении рецептов и пересчёт списков покупок.
+
+    Изменения ингредиентов и тегов внутри блока копятся: на выходе
+    изменённые рецепты отмечаются одним запросом, а списки покупок
+    пересчитываются одним проходом на рецепт.
+    '''
+    return deferred('recipes', dict, flush_recipe_updates)
+
+
+def defer_shopping_list_refresh():
+    '''
+    Откладывает пересчёт списков покупок при удалении из корзин.
+
+    Внутри блока запоминаются только пользователи, чьи корзины
+    изменились. На выходе их списки пересчитываются целиком одним
+    проходом вместо пересчёта на каждую удалённую запись.
+    '''
+    return deferred('carts', set, ShoppingListItem.objects.refresh)
+
+
+def defer_cart_refresh(user_id):
+    pending = get_pending('carts')
+    if pending is None:
+        return False
+    pending.add(user_id)
+    return True
+
+
+def flush_counters(pending):
+    if pending['favorites']:
+        Recipe.objects.filter(
+            pk__in=pending['favorites'],
+        ).refresh_favorites_count()
+    if pending['authors']:
+        Recipe.objects.refresh_authors_recipes_count(pending['authors'])
+    if pending['followers']:
+        Follow.objects.refresh_followers_count(pending['followers'])
+
+
+def defer_counters():
+    '''
+    Откладывает изменение счётчиков избранного, рецептов и подписчиков.
+
+    Внутри блока запоминаются только рецепты и авторы, чьи счётчики
+    должны измениться. На выходе счётчики пересчитываются по таблицам
+    одним запросом на вид счётчика вместо UPDATE на каждую запись.
+    '''
+    return deferred(
+        'counters',
+        lambda: {'favorites': set(), 'authors': set(), 'followers': set()},
+        flush_counters,
+    )
+
+
+def change_counter(queryset, field, kind, pk, delta):
+    '''Меняет счётчик сразу или откладывает; True, если изменён сразу.'''
+    pending = get_pending('counters')
+    if pending is not None:
+        pending[kind].add(pk)
+        return False
+    queryset = queryset.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+    return True
+
+
+def change_favorites_count(recipe_id, delta):
+    if change_counter(
+        Recipe.objects, 'favorites_count', 'favorites', recipe_id, delta,
+    ):
+        favorites_count_changed.send(sender=Recipe)
+
+
+def change_recipes_count(author_id, delta):
+    change_counter(User.objects, 'recipes_count', 'authors', author_id, delta)
+
+
+def change_followers_count(author_id, delta):
+    change_counter(
+        User.objects, 'followers_count', 'followers', author_id, delta,
+    )
+
+
+def refresh_recipe_shopping_lists(recipe_id, ingredient_ids):
+    pending = get_pending('recipes')
+    if pending is None:
+        ShoppingListItem.objects.refresh_recipe(recipe_id, ingredient_ids)
+    else:
+        pending.setdefault(recipe_id, set()).update(ingredient_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    if (instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_variants(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_recipes_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_recipes_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_favorites_count(instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    change_favorites_count(instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        change_followers_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    change_followers_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    touch_recipe(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        touch_recipe(instance.pk)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created and not defer_cart_refresh(instance.user_id):
+        ShoppingListItem.objects.refresh(
+            [instance.user_id],
+            RecipeIngredient.objects.filter(
+                recipe=instance.recipe_id,
+            ).values_list('ingredient', flat=True),
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removing(sender, instance, **kwargs):
+    if get_pending('carts') is not None:
+        return
+    instance.ingredient_ids = list(RecipeIngredient.objects.filter(
+        recipe=instance.recipe_id,
+    ).values_list('ingredient', flat=True))
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    if defer_cart_refresh(instance.user_id):
+        return
+    ShoppingListItem.objects.refresh(
+        [instance.user_id], getattr(instance, 'ingredient_ids', None),
+    )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, **kwargs):
+    instance.previous_ingredient_id = RecipeIngredient.objects.filter(
+        pk=instance.pk,
+    ).values_list('ingredient', flat=True).first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def carted_recipe_ingredients_changed(sender, instance, **kwargs):
+    ingredient_ids = {instance.ingredient_id}
+    previous_ingredient_id = getattr(instance, 'previous_ingredient_id', None)
+    if previous_ingredient_id is not None:
+        ingredient_ids.add(previous_ingredient_id)
+    refresh_recipe_shopping_lists(instance.recipe_id, ingredient_ids)
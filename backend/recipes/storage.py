@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Хранилище, в котором имя файла — хеш его содержимого.
+
+    Файл сохраняется как <каталог>/<sha256><расширение>. Одинаковые
+    файлы хранятся один раз: если файл с таким хешем уже есть,
+    возвращается его имя без записи, а время изменения файла
+    обновляется. Содержимое файла по имени никогда не меняется,
+    поэтому его можно кешировать навсегда. Файлы не удаляются вместе
+    с рецептами, ненужные убирает команда gc_recipe_images: свежее
+    время изменения не даёт ей удалить файл, на который только что
+    сослался ещё не сохранённый рецепт.
+    '''
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest.hexdigest() + extension)
+
+    def get_available_name(self, name, max_length=None):
+        '''
+        Имя по хешу содержимого не меняется.
+
+        Занятое имя означает тот же файл, поэтому вместо имени
+        с суффиксом выбрасывается FileExistsError, и _save считает
+        это совпадением, а не пишет дубль.
+        '''
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Тот же файл успела создать параллельная загрузка (O_EXCL).
+            if not self.exists(name):
+                raise
+            return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(self.generate_filename(name), content)
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                pass
+            else:
+                return name
+        return self._save(name, content)
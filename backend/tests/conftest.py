@@ -0,0 +1,113 @@
+import base64
+import uuid
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD'
+    'hgGAWjR9awAAAABJRU5ErkJggg=='
+)
+IMAGE = 'data:image/png;base64,' + base64.b64encode(PNG).decode()
+
+
+def unique(prefix):
+    '''Имя, не совпадающее с данными бенчмарков в той же базе.'''
+    return f'{prefix}-{uuid.uuid4().hex[:8]}'
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+@pytest.fixture
+def shared_cache(settings, tmp_path):
+    '''Общий для процессов бэкенд кеша, с ним включается кеш ответов.'''
+    settings.CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(tmp_path / 'cache'),
+    }}
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user():
+        name = unique('user')
+        return User.objects.create_user(
+            username=name, email=f'{name}@foodgram.ru',
+            first_name='Имя', last_name='Фамилия', password='!',
+        )
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def client_for():
+    def client_for(user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    return client_for
+
+
+@pytest.fixture
+def tag(db):
+    return Tag.objects.create(
+        name=unique('тег'), color=f'#{uuid.uuid4().hex[:6]}',
+        slug=unique('tag'),
+    )
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(
+            name=unique('ингредиент'), measurement_unit='г',
+        )
+        for _ in range(4)
+    ]
+
+
+@pytest.fixture
+def make_recipe(tag):
+    '''Рецепт автора с ингредиентами {ингредиент: количество}.'''
+    def make_recipe(author, amounts=None, **kwargs):
+        recipe = Recipe(
+            author=author, name=kwargs.pop('name', unique('рецепт')),
+            text='Описание', cooking_time=10, **kwargs,
+        )
+        recipe.image.save('test.png', ContentFile(PNG), save=False)
+        recipe.save()
+        recipe.tags.set([tag])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient, amount=amount,
+            )
+            for ingredient, amount in (amounts or {}).items()
+        )
+        return recipe
+    return make_recipe
+
+
+def recipe_payload(tag, amounts, **kwargs):
+    '''Тело запроса на создание или изменение рецепта.'''
+    return {
+        'name': unique('рецепт'), 'text': 'Описание', 'cooking_time': 10,
+        'image': IMAGE, 'tags': [tag.pk],
+        'ingredients': [
+            {'id': ingredient.pk, 'amount': amount}
+            for ingredient, amount in amounts.items()
+        ],
+        **kwargs,
+    }
@@ -0,0 +1,43 @@
+from rest_framework.test import APIClient
+
+
+def popular_ids(client, author):
+    response = client.get(
+        f'/api/recipes/?author={author.pk}&ordering=popular',
+    )
+    assert response.status_code == 200
+    return (
+        response['X-Cache'],
+        [recipe['id'] for recipe in response.data['results']],
+    )
+
+
+def test_process_local_cache_is_not_used(make_user, make_recipe):
+    author = make_user()
+    make_recipe(author)
+    anon = APIClient()
+    anon.get(f'/api/recipes/?author={author.pk}')
+
+    response = anon.get(f'/api/recipes/?author={author.pk}')
+
+    assert response.status_code == 200
+    assert not response.has_header('X-Cache')
+
+
+def test_favorite_reorders_cached_popular_listing(
+    shared_cache, make_user, client_for, make_recipe,
+    django_capture_on_commit_callbacks,
+):
+    author = make_user()
+    first, second = make_recipe(author), make_recipe(author)
+    anon = APIClient()
+    popular_ids(anon, author)
+    assert popular_ids(anon, author) == ('HIT', [second.pk, first.pk])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client_for(make_user()).post(
+            f'/api/recipes/{first.pk}/favorite/',
+        )
+    assert response.status_code == 201
+
+    assert popular_ids(anon, author) == ('MISS', [first.pk, second.pk])
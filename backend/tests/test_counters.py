@@ -0,0 +1,141 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from recipes.models import Recipe
+
+from .conftest import recipe_payload
+
+User = get_user_model()
+
+
+def favorites_count(recipe):
+    return Recipe.objects.values_list(
+        'favorites_count', flat=True,
+    ).get(pk=recipe.pk)
+
+
+def test_favorite_add_and_remove(
+    user, make_user, client_for, make_recipe,
+):
+    recipe = make_recipe(make_user())
+    client = client_for(user)
+    url = f'/api/recipes/{recipe.pk}/favorite/'
+
+    assert client.post(url).status_code == 201
+    assert favorites_count(recipe) == 1
+    assert client.post(url).status_code == 400
+    assert favorites_count(recipe) == 1
+    client_for(make_user()).post(url)
+    assert favorites_count(recipe) == 2
+    assert client.delete(url).status_code == 204
+    assert favorites_count(recipe) == 1
+
+
+def test_batch_favorite_add_and_remove(
+    user, make_user, client_for, make_recipe,
+):
+    author = make_user()
+    recipes = [make_recipe(author) for _ in range(3)]
+    client = client_for(user)
+    client.post(f'/api/recipes/{recipes[0].pk}/favorite/')
+    payload = {'recipes': [recipe.pk for recipe in recipes]}
+
+    for _ in range(2):
+        response = client.post(
+            '/api/recipes/favorite/batch/', payload, format='json',
+        )
+        assert response.status_code == 201
+        assert [favorites_count(recipe) for recipe in recipes] == [1, 1, 1]
+    for _ in range(2):
+        response = client.delete(
+            '/api/recipes/favorite/batch/', payload, format='json',
+        )
+        assert response.status_code == 204
+        assert [favorites_count(recipe) for recipe in recipes] == [0, 0, 0]
+
+
+def test_popular_ordering_follows_favorites(
+    user, make_user, client_for, make_recipe,
+):
+    author = make_user()
+    recipes = [make_recipe(author) for _ in range(3)]
+    for recipe, fans in zip(recipes, (1, 3, 2)):
+        for _ in range(fans):
+            client_for(make_user()).post(f'/api/recipes/{recipe.pk}/favorite/')
+
+    response = client_for(user).get(
+        f'/api/recipes/?author={author.pk}&ordering=popular',
+    )
+
+    assert [recipe['id'] for recipe in response.data['results']] == [
+        recipes[1].pk, recipes[2].pk, recipes[0].pk,
+    ]
+
+
+def test_recipes_count_on_create_and_delete(
+    user, client_for, tag, ingredients,
+):
+    client = client_for(user)
+    recipe_ids = [
+        client.post(
+            '/api/recipes/', recipe_payload(tag, {ingredients[0]: 1}),
+            format='json',
+        ).data['id']
+        for _ in range(2)
+    ]
+    user.refresh_from_db()
+    assert user.recipes_count == 2
+
+    assert client.delete(f'/api/recipes/{recipe_ids[0]}/').status_code == 204
+    user.refresh_from_db()
+    assert user.recipes_count == 1
+
+
+def test_followers_count_on_subscribe_and_unsubscribe(
+    user, make_user, client_for,
+):
+    client = client_for(make_user())
+    other = client_for(make_user())
+
+    assert client.post(f'/api/users/{user.pk}/subscribe/').status_code == 201
+    other.post(f'/api/users/{user.pk}/subscribe/')
+    assert client.post(f'/api/users/{user.pk}/subscribe/').status_code == 400
+    user.refresh_from_db()
+    assert user.followers_count == 2
+
+    assert client.delete(f'/api/users/{user.pk}/subscribe/').status_code == 204
+    assert client.delete(f'/api/users/{user.pk}/subscribe/').status_code == 400
+    user.refresh_from_db()
+    assert user.followers_count == 1
+
+
+def test_reconcile_counters_repairs_drift(
+    user, make_user, client_for, make_recipe,
+):
+    recipe = make_recipe(user)
+    follower = make_user()
+    client_for(follower).post(f'/api/recipes/{recipe.pk}/favorite/')
+    client_for(follower).post(f'/api/users/{user.pk}/subscribe/')
+    Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+    User.objects.filter(pk=user.pk).update(
+        recipes_count=0, followers_count=7,
+    )
+
+    call_command('reconcile_counters', stdout=StringIO())
+
+    assert favorites_count(recipe) == 1
+    user.refresh_from_db()
+    assert (user.recipes_count, user.followers_count) == (1, 1)
+
+
+def test_favorite_of_missing_recipe(user, client_for, make_recipe):
+    client = client_for(user)
+    recipe = make_recipe(user)
+    url = f'/api/recipes/{recipe.pk}/favorite/'
+    recipe.delete()
+
+    assert client.post(url).status_code == 400
+    assert client.delete(url).status_code == 404
+    assert client.post('/api/recipes/abc/favorite/').status_code == 404
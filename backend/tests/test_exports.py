@@ -0,0 +1,66 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.exports import enqueue_export, process_export
+from recipes.models import ShoppingListExport
+
+
+def export(user, name, expires_at):
+    return ShoppingListExport.objects.create(
+        user=user, format='txt', cart_hash=name,
+        status=ShoppingListExport.DONE, file=name,
+        finished_at=timezone.now(), expires_at=expires_at,
+    )
+
+
+def test_finished_export_gets_expiry(settings, user):
+    settings.EXPORT_TTL = 60
+
+    job = process_export(enqueue_export(user, 'txt'))
+
+    assert job.status == ShoppingListExport.DONE
+    assert job.expires_at == job.finished_at + timedelta(seconds=60)
+
+
+def test_expired_export_is_not_reused(user):
+    job = process_export(enqueue_export(user, 'txt'))
+    ShoppingListExport.objects.filter(pk=job.pk).update(
+        expires_at=timezone.now(),
+    )
+
+    assert enqueue_export(user, 'txt').status == ShoppingListExport.PENDING
+
+
+def test_delete_expired_keeps_shared_files(user):
+    now = timezone.now()
+    stale = default_storage.save('shopping_lists/a.txt', ContentFile(b'a'))
+    shared = default_storage.save('shopping_lists/b.txt', ContentFile(b'b'))
+    expired = [
+        export(user, stale, now - timedelta(seconds=1)),
+        export(user, shared, now - timedelta(seconds=1)),
+    ]
+    live = export(user, shared, now + timedelta(hours=1))
+
+    call_command('delete_expired_exports', stdout=StringIO())
+
+    assert not ShoppingListExport.objects.filter(
+        pk__in=[job.pk for job in expired],
+    ).exists()
+    assert ShoppingListExport.objects.filter(pk=live.pk).exists()
+    assert not default_storage.exists(stale)
+    assert default_storage.exists(shared)
+
+
+def test_worker_deletes_expired_exports_when_idle(user):
+    name = default_storage.save('shopping_lists/c.txt', ContentFile(b'c'))
+    job = export(user, name, timezone.now() - timedelta(seconds=1))
+
+    call_command('process_shopping_list_exports', '--once', stdout=StringIO())
+
+    assert not ShoppingListExport.objects.filter(pk=job.pk).exists()
+    assert not default_storage.exists(name)
@@ -0,0 +1,90 @@
+import pytest
+
+from recipes.models import FeedEntry
+
+from .conftest import recipe_payload
+
+
+@pytest.fixture(autouse=True)
+def fanout_limit(settings):
+    settings.FEED_FANOUT_LIMIT = 1
+
+
+@pytest.fixture
+def authors(make_user):
+    return make_user(), make_user()
+
+
+@pytest.fixture
+def publish(client_for, tag, ingredients):
+    def publish(author):
+        response = client_for(author).post(
+            '/api/recipes/', recipe_payload(tag, {ingredients[0]: 1}),
+            format='json',
+        )
+        assert response.status_code == 201
+        return response.data['id']
+    return publish
+
+
+@pytest.fixture
+def feed(user, make_user, client_for, authors, publish):
+    '''
+    Лента, в которой автор fanned рассылается по таймлайнам,
+    а у автора pulled подписчиков больше лимита и он читается при чтении.
+    '''
+    fanned, pulled = authors
+    old = [publish(fanned), publish(pulled)]
+    response = client_for(make_user()).post(
+        f'/api/users/{pulled.pk}/subscribe/',
+    )
+    assert response.status_code == 201
+    client = client_for(user)
+    for author in authors:
+        response = client.post(f'/api/users/{author.pk}/subscribe/')
+        assert response.status_code == 201
+    new = [publish(author) for author in (fanned, pulled, fanned, pulled)]
+    return list(reversed(old + new))
+
+
+def read(client, url):
+    recipe_ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        recipe_ids.extend(recipe['id'] for recipe in response.data['results'])
+        url = response.data['next']
+    return recipe_ids
+
+
+def test_feed_merges_fanned_out_and_pulled_authors(user, client_for, feed):
+    assert read(client_for(user), '/api/recipes/feed/?limit=10') == feed
+
+
+def test_feed_pages_do_not_repeat_recipes(user, client_for, feed):
+    assert read(client_for(user), '/api/recipes/feed/?limit=2') == feed
+
+
+def test_only_fanned_out_author_has_timeline_entries(user, authors, feed):
+    fanned, pulled = authors
+
+    entries = FeedEntry.objects.filter(user=user)
+
+    assert set(entries.values_list('recipe__author', flat=True)) == {
+        fanned.pk,
+    }
+    assert entries.count() == 3
+
+
+def test_unsubscribe_removes_author_from_feed(
+    user, client_for, authors, feed,
+):
+    client = client_for(user)
+
+    for author in authors:
+        response = client.delete(f'/api/users/{author.pk}/subscribe/')
+        assert response.status_code == 204
+        removed = set(author.recipes.values_list('id', flat=True))
+        feed = [recipe_id for recipe_id in feed if recipe_id not in removed]
+        assert read(client, '/api/recipes/feed/?limit=10') == feed
+    assert not FeedEntry.objects.filter(user=user).exists()
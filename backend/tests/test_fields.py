@@ -0,0 +1,36 @@
+import base64
+
+import pytest
+from rest_framework.exceptions import ValidationError
+
+from api.fields import Base64ImageField
+
+from .conftest import PNG
+
+
+def data_uri(line_length=None):
+    encoded = base64.b64encode(PNG).decode()
+    if line_length:
+        encoded = '\r\n'.join(
+            encoded[start:start + line_length]
+            for start in range(0, len(encoded), line_length)
+        )
+    return 'data:image/png;base64,' + encoded
+
+
+def test_wrapped_base64_at_size_limit_is_accepted(settings):
+    settings.IMAGE_UPLOAD_MAX_SIZE = len(PNG)
+
+    file = Base64ImageField().to_internal_value(data_uri(line_length=4))
+
+    assert file.size == len(PNG)
+    assert file.name == 'temp.png'
+
+
+def test_base64_over_size_limit_is_rejected(settings):
+    settings.IMAGE_UPLOAD_MAX_SIZE = len(PNG) - 1
+
+    with pytest.raises(ValidationError) as error:
+        Base64ImageField().to_internal_value(data_uri())
+
+    assert error.value.detail[0].code == 'too_large'
@@ -0,0 +1,54 @@
+import random
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from recipes import images
+from recipes.images import VARIANTS, build_recipe_variants
+from recipes.models import Recipe
+
+
+def unique_png():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), random.randrange(2 ** 24)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_variants_are_saved_for_current_image(user, make_recipe):
+    recipe = make_recipe(user)
+
+    assert build_recipe_variants(recipe.pk)
+
+    recipe.refresh_from_db()
+    assert recipe.image_variants['source'] == recipe.image.name
+    for variant in VARIANTS:
+        assert recipe.image.storage.exists(recipe.image_variants[variant])
+
+
+def test_variants_of_replaced_image_are_discarded(
+    user, make_recipe, monkeypatch,
+):
+    recipe = make_recipe(user)
+    storage = recipe.image.storage
+    recipe.image.save('old.png', ContentFile(unique_png()))
+    replacement = storage.save(
+        'recipes/images/new.png', ContentFile(unique_png()),
+    )
+    built = {}
+    generate_variants = images.generate_variants
+
+    def generate_then_replace(name, storage):
+        built.update(generate_variants(name, storage))
+        Recipe.objects.filter(pk=recipe.pk).update(image=replacement)
+        return built
+
+    monkeypatch.setattr(images, 'generate_variants', generate_then_replace)
+
+    assert not build_recipe_variants(recipe.pk)
+
+    recipe.refresh_from_db()
+    assert recipe.image.name == replacement
+    assert recipe.image_variants.get('source') != built['source']
+    for variant in VARIANTS:
+        assert not storage.exists(built[variant])
@@ -0,0 +1,58 @@
+import pytest
+from rest_framework.test import APIClient
+
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+@pytest.fixture
+def anon(ingredients):
+    '''Анонимный клиент и индекс, сверенный с базой после ingredients.'''
+    ingredient_index.get_version(check=True)
+    return APIClient()
+
+
+def names(response):
+    return [ingredient['name'] for ingredient in response.data]
+
+
+def test_warm_search_does_not_query_database(
+    settings, anon, ingredients, django_assert_num_queries,
+):
+    settings.INGREDIENT_VERSION_CHECK_INTERVAL = 60
+    url = f'/api/ingredients/?name={ingredients[0].name}'
+    anon.get(url)
+
+    with django_assert_num_queries(0):
+        response = anon.get(url)
+
+    assert names(response) == [ingredients[0].name]
+
+
+def test_search_sees_new_ingredient_after_check_interval(
+    settings, anon, ingredients,
+):
+    settings.INGREDIENT_VERSION_CHECK_INTERVAL = 0
+    prefix = ingredients[0].name
+    anon.get(f'/api/ingredients/?name={prefix}')
+
+    Ingredient.objects.create(name=f'{prefix} новый', measurement_unit='г')
+
+    assert names(anon.get(f'/api/ingredients/?name={prefix}')) == [
+        prefix, f'{prefix} новый',
+    ]
+
+
+def test_if_none_match_checks_version_in_database(
+    settings, anon, ingredients,
+):
+    settings.INGREDIENT_VERSION_CHECK_INTERVAL = 60
+    url = f'/api/ingredients/?name={ingredients[0].name}'
+    etag = anon.get(url)['ETag']
+    assert anon.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    ingredients[0].save()
+
+    response = anon.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
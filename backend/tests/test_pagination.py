@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+@pytest.fixture
+def recipes(user, make_recipe):
+    '''Семь рецептов автора, часть с одинаковой датой публикации.'''
+    recipes = [make_recipe(user) for _ in range(7)]
+    now = timezone.now()
+    for index, recipe in enumerate(recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            pub_date=now - timedelta(minutes=index // 3),
+        )
+    return list(Recipe.objects.filter(author=user).order_by(
+        '-pub_date', '-id',
+    ).values_list('pk', flat=True))
+
+
+def walk(client, url, link):
+    '''Собирает страницы, переходя по ссылке link до конца.'''
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([recipe['id'] for recipe in response.data['results']])
+        url = response.data[link]
+    return pages
+
+
+def test_cursor_next_walks_all_recipes(user, client_for, recipes):
+    pages = walk(
+        client_for(user), f'/api/recipes/?author={user.pk}&cursor=&limit=3',
+        'next',
+    )
+
+    assert pages == [recipes[:3], recipes[3:6], recipes[6:]]
+
+
+def test_cursor_matches_page_numbers(user, client_for, recipes):
+    client = client_for(user)
+    cursor_pages = walk(
+        client, f'/api/recipes/?author={user.pk}&cursor=&limit=3', 'next',
+    )
+    number_pages = walk(
+        client, f'/api/recipes/?author={user.pk}&limit=3', 'next',
+    )
+
+    assert cursor_pages == number_pages
+
+
+def test_cursor_previous_round_trip(user, client_for, recipes):
+    client = client_for(user)
+    url = f'/api/recipes/?author={user.pk}&cursor=&limit=3'
+    first = client.get(url).data
+    assert first['previous'] is None
+    last = client.get(client.get(first['next']).data['next']).data
+    assert last['next'] is None
+
+    pages = walk(client, last['previous'], 'previous')
+
+    assert pages == [recipes[3:6], recipes[:3]]
+
+
+def test_cursor_sees_new_recipe_on_first_page(
+    user, client_for, make_recipe, recipes,
+):
+    client = client_for(user)
+    first = client.get(
+        f'/api/recipes/?author={user.pk}&cursor=&limit=3',
+    ).data
+    second = client.get(first['next']).data
+    recipe = make_recipe(user)
+
+    previous = client.get(second['previous']).data
+    newest = client.get(previous['previous']).data
+
+    assert [item['id'] for item in previous['results']] == recipes[:3]
+    assert [item['id'] for item in newest['results']] == [recipe.pk]
+
+
+def test_invalid_cursor_is_rejected(user, client_for):
+    response = client_for(user).get('/api/recipes/?cursor=bad')
+
+    assert response.status_code == 404
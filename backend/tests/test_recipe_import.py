@@ -0,0 +1,36 @@
+import json
+
+from api.recipe_import import import_recipes
+from recipes.models import Recipe
+
+
+def line(name, image, tag, ingredient):
+    return json.dumps({
+        'name': name, 'text': 'Описание', 'cooking_time': 5,
+        'image': image, 'tags': [tag.slug],
+        'ingredients': [{
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+            'amount': 1,
+        }],
+    })
+
+
+def test_row_with_missing_image_is_rejected(
+    user, make_recipe, tag, ingredients,
+):
+    image = make_recipe(user).image.name
+    lines = [
+        line('Рецепт с картинкой', image, tag, ingredients[0]),
+        line('Рецепт без картинки', 'recipes/images/missing.png', tag,
+             ingredients[0]),
+    ]
+
+    report = import_recipes(lines, user)
+
+    assert report['imported'] == 1
+    assert [error['line'] for error in report['errors']] == [2]
+    assert 'image' in report['errors'][0]['errors']
+    assert list(Recipe.objects.filter(
+        author=user, name__startswith='Рецепт ',
+    ).values_list('name', flat=True)) == ['Рецепт с картинкой']
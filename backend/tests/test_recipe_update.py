@@ -0,0 +1,86 @@
+from recipes.models import RecipeIngredient
+
+from .conftest import recipe_payload
+
+
+def rows(recipe):
+    return {
+        row.ingredient_id: (row.pk, row.amount)
+        for row in RecipeIngredient.objects.filter(recipe=recipe)
+    }
+
+
+def test_patch_updates_ingredients_by_diff(
+    user, client_for, make_recipe, tag, ingredients,
+):
+    changed, removed, unchanged, added = ingredients
+    recipe = make_recipe(user, {changed: 1, removed: 2, unchanged: 3})
+    before = rows(recipe)
+
+    response = client_for(user).patch(
+        f'/api/recipes/{recipe.pk}/',
+        {'ingredients': [
+            {'id': changed.pk, 'amount': 10},
+            {'id': unchanged.pk, 'amount': 3},
+            {'id': added.pk, 'amount': 4},
+        ]},
+        format='json',
+    )
+
+    assert response.status_code == 200
+    assert {
+        item['id']: item['amount'] for item in response.data['ingredients']
+    } == {changed.pk: 10, unchanged.pk: 3, added.pk: 4}
+    after = rows(recipe)
+    assert removed.pk not in after
+    assert after[changed.pk] == (before[changed.pk][0], 10)
+    assert after[unchanged.pk] == before[unchanged.pk]
+    assert after[added.pk][1] == 4
+
+
+def test_patch_without_ingredients_keeps_them(
+    user, client_for, make_recipe, ingredients,
+):
+    recipe = make_recipe(user, {ingredients[0]: 5})
+    before = rows(recipe)
+
+    response = client_for(user).patch(
+        f'/api/recipes/{recipe.pk}/', {'name': 'Новое название'},
+        format='json',
+    )
+
+    assert response.status_code == 200
+    assert rows(recipe) == before
+
+
+def test_patch_marks_recipe_updated(
+    user, client_for, make_recipe, tag, ingredients,
+):
+    recipe = make_recipe(user, {ingredients[0]: 1})
+
+    response = client_for(user).patch(
+        f'/api/recipes/{recipe.pk}/',
+        {'ingredients': [{'id': ingredients[0].pk, 'amount': 2}]},
+        format='json',
+    )
+
+    assert response.status_code == 200
+    updated_at = recipe.updated_at
+    recipe.refresh_from_db()
+    assert recipe.updated_at > updated_at
+
+
+def test_put_rejects_duplicate_ingredients(
+    user, client_for, make_recipe, tag, ingredients,
+):
+    recipe = make_recipe(user, {ingredients[0]: 1})
+    before = rows(recipe)
+    payload = recipe_payload(tag, {ingredients[0]: 1})
+    payload['ingredients'].append({'id': ingredients[0].pk, 'amount': 2})
+
+    response = client_for(user).put(
+        f'/api/recipes/{recipe.pk}/', payload, format='json',
+    )
+
+    assert response.status_code == 400
+    assert rows(recipe) == before
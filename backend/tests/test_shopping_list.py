@@ -0,0 +1,149 @@
+import pytest
+
+from recipes.models import ShoppingListItem
+
+
+def totals(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient', 'total_amount',
+    ))
+
+
+def computed(user):
+    return {
+        ingredient_id: total_amount
+        for _, ingredient_id, total_amount
+        in ShoppingListItem.objects.totals([user.pk])
+    }
+
+
+@pytest.fixture
+def cart(user, make_user, client_for, make_recipe, ingredients):
+    '''Два рецепта с общим ингредиентом в корзине пользователя.'''
+    shared, first, second, _ = ingredients
+    author = make_user()
+    recipes = [
+        make_recipe(author, {shared: 100, first: 1}),
+        make_recipe(author, {shared: 50, second: 2}),
+    ]
+    client = client_for(user)
+    for recipe in recipes:
+        response = client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        assert response.status_code == 201
+    return author, recipes
+
+
+def test_adding_to_cart_sums_amounts(user, cart, ingredients):
+    shared, first, second, _ = ingredients
+
+    assert totals(user) == {shared.pk: 150, first.pk: 1, second.pk: 2}
+    assert totals(user) == computed(user)
+
+
+def test_recipe_edit_recalculates_totals(
+    user, cart, client_for, ingredients,
+):
+    author, (recipe, _) = cart
+    shared, first, second, added = ingredients
+
+    response = client_for(author).patch(
+        f'/api/recipes/{recipe.pk}/',
+        {'ingredients': [
+            {'id': shared.pk, 'amount': 30},
+            {'id': added.pk, 'amount': 7},
+        ]},
+        format='json',
+    )
+
+    assert response.status_code == 200
+    assert totals(user) == {shared.pk: 80, second.pk: 2, added.pk: 7}
+    assert totals(user) == computed(user)
+
+
+def test_recipe_delete_recalculates_totals(
+    user, cart, client_for, ingredients,
+):
+    author, (recipe, _) = cart
+    shared, _, second, _ = ingredients
+
+    response = client_for(author).delete(f'/api/recipes/{recipe.pk}/')
+
+    assert response.status_code == 204
+    assert totals(user) == {shared.pk: 50, second.pk: 2}
+
+
+def test_cart_removal_recalculates_totals(
+    user, cart, client_for, ingredients,
+):
+    _, (recipe, _) = cart
+    shared, _, second, _ = ingredients
+
+    response = client_for(user).delete(
+        f'/api/recipes/{recipe.pk}/shopping_cart/',
+    )
+
+    assert response.status_code == 204
+    assert totals(user) == {shared.pk: 50, second.pk: 2}
+    assert totals(user) == computed(user)
+
+
+def test_batch_cart_removal_clears_totals(user, cart, client_for):
+    _, recipes = cart
+
+    response = client_for(user).delete(
+        '/api/recipes/shopping_cart/batch/',
+        {'recipes': [recipe.pk for recipe in recipes]},
+        format='json',
+    )
+
+    assert response.status_code == 204
+    assert totals(user) == {}
+
+
+def test_batch_cart_add_sums_amounts(
+    user, make_user, client_for, make_recipe, ingredients,
+):
+    shared, first, _, _ = ingredients
+    author = make_user()
+    recipes = [
+        make_recipe(author, {shared: 10}),
+        make_recipe(author, {shared: 20, first: 3}),
+    ]
+
+    response = client_for(user).post(
+        '/api/recipes/shopping_cart/batch/',
+        {'recipes': [recipe.pk for recipe in recipes]},
+        format='json',
+    )
+
+    assert response.status_code == 201
+    assert totals(user) == {shared.pk: 30, first.pk: 3}
+
+
+def test_other_users_totals_are_kept(
+    user, cart, make_user, client_for, ingredients,
+):
+    _, (recipe, _) = cart
+    shared, first, _, _ = ingredients
+    other = make_user()
+    client_for(other).post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    client_for(user).delete(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    assert totals(other) == {shared.pk: 100, first.pk: 1}
+
+
+def test_cart_toggle_is_idempotent(user, cart, client_for, ingredients):
+    _, (recipe, _) = cart
+    client = client_for(user)
+    shared, first, second, _ = ingredients
+
+    assert client.post(
+        f'/api/recipes/{recipe.pk}/shopping_cart/',
+    ).status_code == 400
+    assert totals(user) == {shared.pk: 150, first.pk: 1, second.pk: 2}
+    client.delete(f'/api/recipes/{recipe.pk}/shopping_cart/')
+    assert client.delete(
+        f'/api/recipes/{recipe.pk}/shopping_cart/',
+    ).status_code == 400
+    assert totals(user) == {shared.pk: 50, second.pk: 2}
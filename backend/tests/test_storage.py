@@ -0,0 +1,27 @@
+import os
+
+from django.core.files.base import ContentFile
+
+from recipes.storage import ContentAddressedStorage
+
+from .conftest import PNG
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    storage = ContentAddressedStorage(location=str(tmp_path))
+    name = storage.hashed_name('images/a.png', ContentFile(PNG))
+
+    assert storage._save(name, ContentFile(PNG)) == name
+    assert storage._save(name, ContentFile(PNG)) == name
+    assert os.listdir(tmp_path / 'images') == [os.path.basename(name)]
+
+
+def test_save_returns_hashed_name_for_duplicates(tmp_path):
+    storage = ContentAddressedStorage(location=str(tmp_path))
+
+    first = storage.save('images/a.png', ContentFile(PNG))
+    second = storage.save('images/b.PNG', ContentFile(PNG))
+
+    assert first == second
+    assert os.listdir(tmp_path / 'images') == [os.path.basename(first)]
+    assert storage.get_available_name('images/c.png') == 'images/c.png'
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 
 class CustomUser(AbstractUser):
@@ -18,6 +20,14 @@ class CustomUser(AbstractUser):
                                  verbose_name='Фамилия пользователя')
     password = models.CharField(max_length=150,
                                 verbose_name='Пароль')
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -28,6 +38,22 @@ class CustomUser(AbstractUser):
         return self.username
 
 
+class FollowQuerySet(models.QuerySet):
+
+    def refresh_followers_count(self, author_ids=None):
+        '''Пересчитывает CustomUser.followers_count (у всех без author_ids).'''
+        authors = CustomUser.objects.all()
+        if author_ids is not None:
+            authors = authors.filter(pk__in=author_ids)
+        return authors.update(followers_count=Coalesce(
+            Subquery(
+                self.model.objects.filter(author=OuterRef('pk')).order_by(
+                ).values('author').annotate(total=Count('pk')).values('total'),
+            ),
+            0,
+        ))
+
+
 class Follow(models.Model):
     '''Модель для подписок.'''
     user = models.ForeignKey(
@@ -43,6 +69,8 @@ class Follow(models.Model):
         verbose_name='Автор',
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'